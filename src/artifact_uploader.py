@@ -0,0 +1,98 @@
+"""Background MLflow artifact uploads and top-K model retention for HPO.
+
+Trials only save their model locally; uploads to the artifact store (MinIO/S3)
+happen on a background thread, so trial throughput does not depend on
+object-store latency. Only the current top-K models by RMSE are kept; evicted
+models are dropped from the upload queue or deleted from the store.
+"""
+import heapq
+import shutil
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from mlflow.tracking import MlflowClient
+from mlflow.store.artifact.artifact_repository_registry import get_artifact_repository
+
+logger = logging.getLogger(__name__)
+
+
+class ArtifactUploader:
+    def __init__(self, max_workers=1, client=None):
+        self._client = client or MlflowClient()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='artifact-upload'
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def upload(self, run_id, local_path, artifact_path=None, cleanup_dir=None):
+        """Queue an upload, returns its Future. cleanup_dir is removed once uploaded."""
+        return self._executor.submit(
+            self._upload, run_id, local_path, artifact_path, cleanup_dir
+        )
+
+    def delete(self, run_id, artifact_path, after=None):
+        """Queue deletion of a run artifact, once the `after` upload has finished."""
+        return self._executor.submit(self._delete, run_id, artifact_path, after)
+
+    def close(self):
+        """Wait for every queued upload and deletion to finish."""
+        self._executor.shutdown(wait=True)
+
+    def _upload(self, run_id, local_path, artifact_path, cleanup_dir):
+        try:
+            self._client.log_artifact(run_id, local_path, artifact_path=artifact_path)
+        except Exception:
+            logger.exception("Artifact upload failed for run %s", run_id)
+            raise
+        finally:
+            if cleanup_dir is not None:
+                shutil.rmtree(cleanup_dir, ignore_errors=True)
+
+    def _delete(self, run_id, artifact_path, after):
+        if after is not None and after.exception() is not None:
+            return  # the upload never made it, nothing to delete
+        try:
+            artifact_uri = self._client.get_run(run_id).info.artifact_uri
+            get_artifact_repository(artifact_uri).delete_artifacts(artifact_path)
+        except Exception:
+            logger.exception("Artifact deletion failed for run %s", run_id)
+            raise
+
+
+class TopKModels:
+    """Keeps the k lowest-RMSE models uploaded, evicting the rest."""
+
+    def __init__(self, k, uploader, artifact_path='model'):
+        self.k = k
+        self.uploader = uploader
+        self.artifact_path = artifact_path
+        self._heap = []  # (-rmse, run_id, upload future, local dir), worst on top
+
+    def offer(self, run_id, rmse, model_path, local_dir):
+        """Upload the model if it ranks in the top k, returns whether it was kept."""
+        if len(self._heap) >= self.k and rmse >= -self._heap[0][0]:
+            shutil.rmtree(local_dir, ignore_errors=True)
+            return False
+
+        future = self.uploader.upload(
+            run_id, model_path, artifact_path=self.artifact_path, cleanup_dir=local_dir
+        )
+        heapq.heappush(self._heap, (-rmse, run_id, future, local_dir))
+        if len(self._heap) > self.k:
+            self._evict(*heapq.heappop(self._heap))
+        return True
+
+    def run_ids(self):
+        return [run_id for _, run_id, _, _ in sorted(self._heap, reverse=True)]
+
+    def _evict(self, neg_rmse, run_id, future, local_dir):
+        logger.info("Evicting model of run %s (rmse %.4f)", run_id, -neg_rmse)
+        if future.cancel():
+            shutil.rmtree(local_dir, ignore_errors=True)
+        else:
+            self.uploader.delete(run_id, self.artifact_path, after=future)
@@ -1,10 +1,10 @@
 import os
 import sys
+import time
 import random
 
 import pandas as pd
 import psycopg
-from catboost import CatBoostRegressor
 from evidently import ColumnMapping
 from evidently.report import Report
 from evidently.metrics import (
@@ -15,7 +15,12 @@ from evidently.metrics import (
     ColumnCorrelationsMetric,
 )
 
+import tracing
 from utils import read_data, get_config, get_features
+from model_store import load_model, resolve_model
+from stage_cache import StageCache
+from features import add_delivery_features
+from geo_index import GeoIndex, GEO_INDEX_DIR_NAME
 
 SEND_TIMEOUT = 10
 rand = random.Random()
@@ -65,13 +70,14 @@ def calculate_metrics_postgresql(
     curr, current_data, end_date, reference_data, report, col_mapping
 ):
 
-    report.run(
-        reference_data=reference_data,
-        current_data=current_data,
-        column_mapping=col_mapping,
-    )
+    with tracing.span('evidently', rows=len(current_data)):
+        report.run(
+            reference_data=reference_data,
+            current_data=current_data,
+            column_mapping=col_mapping,
+        )
 
-    result = report.as_dict()
+        result = report.as_dict()
 
     prediction_drift = result['metrics'][0]['result']['drift_score']
     num_drifted_columns = result['metrics'][1]['result']['number_of_drifted_columns']
@@ -87,33 +93,36 @@ def calculate_metrics_postgresql(
     else:
         prediction_corr_with_features = 0.0
 
-    curr.execute(
-        "insert into public.model_metrics("
-        "timestamp, prediction_drift, num_drifted_columns, share_missing_values, value_range_share_in_range, prediction_corr_with_features"
-        ") values (%s, %s, %s, %s, %s, %s)",
-        (
-            end_date,
-            prediction_drift,
-            num_drifted_columns,
-            share_missing_values,
-            value_range_share_in_range,
-            prediction_corr_with_features,
-        ),
-    )
+    with tracing.span('postgres_write'):
+        curr.execute(
+            "insert into public.model_metrics("
+            "timestamp, prediction_drift, num_drifted_columns, share_missing_values, value_range_share_in_range, prediction_corr_with_features"
+            ") values (%s, %s, %s, %s, %s, %s)",
+            (
+                end_date,
+                prediction_drift,
+                num_drifted_columns,
+                share_missing_values,
+                value_range_share_in_range,
+                prediction_corr_with_features,
+            ),
+        )
 
 
-if __name__ == '__main__':
-    config = get_config(sys.argv[1])
+@tracing.traced()
+def run_backfill(config, model_uri, data_dir='/srv/data', metrics_cursor=None):
+    """Write drift metrics for every backfill window, returns per-window timings.
 
+    Metrics go to the monitoring database unless a metrics_cursor is given.
+    """
     start_dt = config['data_params']['backfill_date_start']
     end_dt = config['data_params']['backfill_date_end']
     pairs = generate_date_ranges(start_dt, end_dt)
-    model_file_name = config['model_file_name']
-    model_path = os.path.join('/srv/data', model_file_name)
-    data_path = os.path.join('/srv/data', 'merged_dataset.csv')
+    data_path = os.path.join(data_dir, 'merged_dataset.csv')
 
-    model = CatBoostRegressor()
-    model.load_model(model_path)
+    with tracing.span('load_model'):
+        model = load_model(model_uri)
+        geo_index = GeoIndex.load(os.path.join(data_dir, GEO_INDEX_DIR_NAME))
 
     ev_column_mapping = ColumnMapping(
         prediction='prediction',
@@ -133,29 +142,92 @@ if __name__ == '__main__':
     )
 
 
-    reference_data_path = os.path.join('/srv/data', 'valid_dataset.csv')
-    reference_data_df = pd.read_csv(reference_data_path)
-    X, _ = get_features(reference_data_df, config)
-    reference_data_df['prediction'] = model.predict(X)
+    reference_data_path = os.path.join(data_dir, 'valid_dataset.csv')
+    with tracing.span('reference_predictions') as span:
+        reference_data_df = add_delivery_features(
+            pd.read_csv(reference_data_path), geo_index
+        )
+        X, _ = get_features(reference_data_df, config)
+        reference_data_df['prediction'] = model.predict(X)
+        span.set(rows=len(reference_data_df))
 
-    prep_db()
+    if metrics_cursor is None:
+        prep_db()
 
+    windows = []
     for start, end in pairs:
-        df = read_data(data_path, f'{start.date()}', f'{end.date()}')
-        X, _ = get_features(df, config)
-        y_pred = model.predict(X)  
-        df['prediction'] = y_pred
-
-        with psycopg.connect(
-            "host=db port=5432 dbname=test user=db_user password=db_password",
-            autocommit=True,
-        ) as conn:
-            with conn.cursor() as cursor:
+        with tracing.span('backfill_window', start=f'{start.date()}') as window_span:
+            window_start = time.perf_counter()
+            with tracing.span('read_data') as read_span:
+                df = read_data(data_path, f'{start.date()}', f'{end.date()}')
+                read_span.set(rows=len(df))
+            with tracing.span('features', rows=len(df)):
+                df = add_delivery_features(df, geo_index)
+                X, _ = get_features(df, config)
+            with tracing.span('model.predict', rows=len(X)):
+                y_pred = model.predict(X)
+            df['prediction'] = y_pred
+
+            if metrics_cursor is None:
+                with psycopg.connect(
+                    "host=db port=5432 dbname=test user=db_user password=db_password",
+                    autocommit=True,
+                ) as conn:
+                    with conn.cursor() as cursor:
+                        calculate_metrics_postgresql(
+                            cursor,
+                            df,
+                            end,
+                            reference_data_df,
+                            ev_report,
+                            ev_column_mapping,
+                        )
+            else:
                 calculate_metrics_postgresql(
-                    cursor, df, end, reference_data_df, ev_report, ev_column_mapping
+                    metrics_cursor,
+                    df,
+                    end,
+                    reference_data_df,
+                    ev_report,
+                    ev_column_mapping,
                 )
-        num_rows = df.shape[0]
-        print(
-            f"Start: {start.date()}, End: {end.date()}, num_rows {num_rows}, "
-            f"prediction mean: {y_pred.mean():.4f}"
-        )
+            num_rows = df.shape[0]
+            window_span.set(rows=num_rows)
+            windows.append({
+                'start': f'{start.date()}',
+                'end': f'{end.date()}',
+                'num_rows': num_rows,
+                'seconds': time.perf_counter() - window_start,
+            })
+            print(
+                f"Start: {start.date()}, End: {end.date()}, num_rows {num_rows}, "
+                f"prediction mean: {y_pred.mean():.4f}"
+            )
+    return windows
+
+
+if __name__ == '__main__':
+    config = get_config(sys.argv[1])
+    model_uri = os.getenv('MODEL_URI', config['model_uri'])
+    _, model_sha = resolve_model(model_uri)
+
+    # The metrics table is rebuilt from scratch, so an unchanged model, data and
+    # window means the table already holds these rows; if the database was reset,
+    # force it with STAGE_CACHE_REFRESH=backfill
+    StageCache('/srv/data').run(
+        'backfill',
+        lambda: run_backfill(config, model_uri),
+        files=[
+            os.path.join('/srv/data', 'merged_dataset.csv'),
+            os.path.join('/srv/data', 'valid_dataset.csv'),
+            os.path.join('/srv/data', GEO_INDEX_DIR_NAME, 'meta.json'),
+        ],
+        config=[
+            config['categorical'],
+            config['numerical'],
+            config['data_params']['backfill_date_start'],
+            config['data_params']['backfill_date_end'],
+        ],
+        code=('batch_prediction_backfill', 'features', 'geo_index', 'utils'),
+        params={'model_sha256': model_sha},
+    )
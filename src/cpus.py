@@ -0,0 +1,28 @@
+"""CPU budget of this process, for splitting cores between workers and threads.
+
+Kept free of third-party imports so the API image can use it too.
+"""
+import os
+
+CGROUP_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+
+
+def available_cpus():
+    """CPUs this process may run on.
+
+    os.cpu_count() reports every core of the host. This counts the affinity
+    mask instead (taskset, docker --cpuset-cpus) and caps it by a cgroup v2
+    CPU quota (docker --cpus, Kubernetes CPU limits).
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # no affinity API outside Linux
+        cpus = os.cpu_count() or 1
+    try:
+        with open(CGROUP_CPU_MAX, encoding='utf-8') as f:
+            quota, period = f.read().split()[:2]
+    except (OSError, ValueError):
+        return cpus
+    if quota != 'max':
+        cpus = min(cpus, max(1, int(quota) // int(period)))
+    return cpus
@@ -0,0 +1,62 @@
+"""Delivery feature stage shared by training, batch scoring and the API.
+
+Works on any column mapping (a DataFrame or a dict of arrays) with plain
+NumPy, so a single API request and a multi-million row batch run the same code.
+"""
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km between coordinate arrays, in float32."""
+    lat1 = np.radians(lat1, dtype=np.float32)
+    lat2 = np.radians(lat2, dtype=np.float32)
+    dlng = np.radians(np.subtract(lng2, lng1, dtype=np.float32))
+    dlat = np.subtract(lat2, lat1)
+
+    # a = sin^2(dlat / 2) + cos(lat1) * cos(lat2) * sin^2(dlng / 2), in place
+    dlat *= 0.5
+    np.sin(dlat, out=dlat)
+    dlat *= dlat
+    dlng *= 0.5
+    np.sin(dlng, out=dlng)
+    dlng *= dlng
+    np.cos(lat1, out=lat1)
+    np.cos(lat2, out=lat2)
+    lat1 *= lat2
+    lat1 *= dlng
+    lat1 += dlat
+
+    np.sqrt(lat1, out=lat1)
+    np.arcsin(lat1, out=lat1)
+    lat1 *= np.float32(2 * EARTH_RADIUS_KM)
+    return lat1
+
+
+def add_delivery_features(frame, geo_index):
+    """Attach seller/customer centroids and delivery_distance_km to `frame`.
+
+    Customer coordinates are looked up by customer_zip_code_prefix only when
+    the frame does not carry customer_lat/customer_lng already. Unknown ZIP
+    prefixes give NaN, which CatBoost treats as a missing value.
+    """
+    seller_lat, seller_lng = geo_index.lookup(
+        np.asarray(frame['seller_zip_code_prefix'])
+    )
+    if 'customer_lat' not in frame or 'customer_lng' not in frame:
+        customer_lat, customer_lng = geo_index.lookup(
+            np.asarray(frame['customer_zip_code_prefix'])
+        )
+        frame['customer_lat'] = customer_lat
+        frame['customer_lng'] = customer_lng
+
+    frame['seller_lat'] = seller_lat
+    frame['seller_lng'] = seller_lng
+    frame['delivery_distance_km'] = haversine_km(
+        seller_lat,
+        seller_lng,
+        np.asarray(frame['customer_lat']),
+        np.asarray(frame['customer_lng']),
+    )
+    return frame
@@ -0,0 +1,100 @@
+"""ZIP-prefix -> centroid index stored as memory-mapped .npy arrays.
+
+Kept free of pandas so the API can resolve ZIP prefixes without loading it.
+"""
+import os
+import json
+
+import numpy as np
+
+ZIP_FILE = 'zip_code_prefix.npy'
+LAT_FILE = 'lat.npy'
+LNG_FILE = 'lng.npy'
+META_FILE = 'meta.json'
+INDEX_FILES = (ZIP_FILE, LAT_FILE, LNG_FILE, META_FILE)
+GEO_INDEX_DIR_NAME = 'geo_index'
+
+
+class GeoIndex:
+    def __init__(self, zip_codes, lat, lng, source=None):
+        self.zip_codes = zip_codes
+        self.lat = lat
+        self.lng = lng
+        self.source = source
+        self._tables = None
+
+    def __len__(self):
+        return len(self.zip_codes)
+
+    @classmethod
+    def from_centroids(cls, zip_codes, lat, lng, source=None):
+        order = np.argsort(zip_codes, kind='stable')
+        return cls(
+            np.asarray(zip_codes, dtype=np.int32)[order],
+            np.asarray(lat, dtype=np.float32)[order],
+            np.asarray(lng, dtype=np.float32)[order],
+            source=source,
+        )
+
+    @classmethod
+    def load(cls, index_dir, mmap_mode='r'):
+        with open(os.path.join(index_dir, META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        return cls(
+            np.load(os.path.join(index_dir, ZIP_FILE), mmap_mode=mmap_mode),
+            np.load(os.path.join(index_dir, LAT_FILE), mmap_mode=mmap_mode),
+            np.load(os.path.join(index_dir, LNG_FILE), mmap_mode=mmap_mode),
+            source=meta.get('source'),
+        )
+
+    def save(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        for file_name, values in (
+            (ZIP_FILE, self.zip_codes),
+            (LAT_FILE, self.lat),
+            (LNG_FILE, self.lng),
+        ):
+            tmp_path = os.path.join(index_dir, f'.{file_name}.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.save(f, values)
+            os.replace(tmp_path, os.path.join(index_dir, file_name))
+
+        # meta.json goes last: a reader never sees it next to half-written arrays
+        tmp_path = os.path.join(index_dir, f'.{META_FILE}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'source': self.source, 'size': len(self)}, f)
+        os.replace(tmp_path, os.path.join(index_dir, META_FILE))
+
+    def tables(self):
+        """Direct-address (lat, lng) tables indexed by ZIP prefix, NaN for unknown ones.
+
+        ZIP prefixes are 5-digit, so the tables stay under 1 MB and every
+        lookup becomes a single gather. The extra trailing NaN slot is what
+        out-of-range keys are pointed at.
+        """
+        if self._tables is None:
+            size = int(self.zip_codes[-1]) + 2 if len(self) else 1
+            lat = np.full(size, np.nan, dtype=np.float32)
+            lng = np.full(size, np.nan, dtype=np.float32)
+            lat[self.zip_codes] = self.lat
+            lng[self.zip_codes] = self.lng
+            self._tables = lat, lng
+        return self._tables
+
+    def lookup(self, zip_codes):
+        """Vectorized lookup, returns (lat, lng) float32 arrays with NaN for misses."""
+        zip_codes = np.asarray(zip_codes)
+        if zip_codes.dtype.kind == 'f':
+            zip_codes = np.where(np.isnan(zip_codes), -1, zip_codes).astype(np.int64)
+        lat, lng = self.tables()
+        in_range = (zip_codes >= 0) & (zip_codes < len(lat) - 1)
+        if not in_range.all():
+            zip_codes = np.where(in_range, zip_codes, -1)
+        return lat[zip_codes], lng[zip_codes]
+
+    def get(self, zip_code):
+        """Single-key lookup, returns (lat, lng) floats or None for an unknown prefix."""
+        lat, lng = self.tables()
+        if not 0 <= zip_code < len(lat) - 1 or np.isnan(lat[zip_code]):
+            return None
+        return float(lat[zip_code]), float(lng[zip_code])
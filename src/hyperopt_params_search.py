@@ -1,89 +1,244 @@
 import os
 import sys
+import time
+import shutil
+import itertools
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
 import numpy as np
 import mlflow
-import pandas as pd
-from hyperopt import STATUS_OK, Trials, hp, tpe, fmin
-from sklearn.metrics import root_mean_squared_error
+from hyperopt import STATUS_OK, Trials, hp, tpe, fmin, space_eval
+from hyperopt.base import JOB_STATE_DONE, Domain
 from catboost import CatBoostRegressor
 
+import tracing
+from cpus import available_cpus
+from pools import load_pools, cache_training_pools
+from artifact_uploader import TopKModels, ArtifactUploader
 from utils import get_model, get_config
+from stage_cache import StageCache
 
-mlflow.set_tracking_uri("http://mlflow_container_ui:5000")
+mlflow.set_tracking_uri(
+    os.getenv("MLFLOW_TRACKING_URI", "http://mlflow_container_ui:5000")
+)
 experiment_name = "catboost-params-new"
 
 try:
-    mlflow.create_experiment(experiment_name, artifact_location="s3://mlflow")
+    mlflow.create_experiment(
+        experiment_name,
+        artifact_location=os.getenv("MLFLOW_ARTIFACT_LOCATION", "s3://mlflow"),
+    )
 except mlflow.exceptions.MlflowException:
     pass  # Experiment already exists
 
 mlflow.set_experiment(experiment_name)
 
+search_space = {
+    'iterations': hp.quniform('iterations', 100, 500, 50),
+    'learning_rate': hp.uniform('learning_rate', 0.01, 0.3),
+    'depth': hp.quniform('depth', 4, 10, 1),
+    'l2_leaf_reg': hp.uniform('l2_leaf_reg', 1, 10),
+}
+
+# Per-process trial state, filled once by init_trial_worker
+_trial_data = {}
 
-def get_features(df, config):
-    categorical = config['categorical']
-    numerical = config['numerical']
-    target = 'delivery_time'
-    X = df[categorical + numerical]
-    y = df[target] if target in df.columns else None
-    return X, y
 
-def get_model(params, categorical):
+def get_model(params, categorical, train_dir="/srv/data/catboost_info", thread_count=-1):
     model = CatBoostRegressor(
         cat_features=categorical,
         verbose=0,
-        train_dir="/srv/data/catboost_info",
+        train_dir=train_dir,
+        thread_count=thread_count,
         **params,
     )
     return model
 
-def run_optimization(root_data_dir: str, num_trials: int):
-    train_data_path = os.path.join(root_data_dir, 'train_dataset.csv')
-    valid_data_path = os.path.join(root_data_dir, 'valid_dataset.csv')
-    artefact_model_path = os.path.join(
-        root_data_dir, 'artefact_model', 'catboost_model.cbm'
-    )
-    os.makedirs(os.path.dirname(artefact_model_path), exist_ok=True)
 
-    # Prepare the training data
-    train_df = pd.read_csv(train_data_path)
-    X_train, y_train = get_features(train_df, config)
+def split_cores(n_workers):
+    """CatBoost threads per trial so that n_workers trials fill the machine."""
+    return max(1, available_cpus() // n_workers)
 
-    valid_df = pd.read_csv(valid_data_path)
-    X_valid, y_valid = get_features(valid_df, config)
 
-    def objective(params):
-        with mlflow.start_run():
+def init_trial_worker(root_data_dir, config, thread_count):
+    _trial_data['pool_files'] = cache_training_pools(root_data_dir, config)
+    _trial_data['early_stopping_rounds'] = config.get('hyperopt', {}).get(
+        'early_stopping_rounds'
+    )
+    _trial_data['config'] = config
+    _trial_data['trials_dir'] = os.path.join(root_data_dir, 'hpo_trials')
+    _trial_data['thread_count'] = thread_count
+
+
+def run_trial(tid, params):
+    """Fit and log one trial; the model stays on disk for the caller to upload.
+
+    Returns (rmse, run_id, model_path, trial_dir).
+    """
+    # Every trial writes to its own scratch dir so concurrent trials don't collide
+    trial_dir = os.path.join(_trial_data['trials_dir'], f'trial_{tid}')
+    train_dir = os.path.join(trial_dir, 'catboost_info')
+    # CatBoost writes cat feature hashes for quantized pools to train_dir/tmp
+    os.makedirs(os.path.join(train_dir, 'tmp'), exist_ok=True)
+    try:
+        with (
+            tracing.span('hpo_trial', tid=tid, **params) as span,
+            mlflow.start_run() as run,
+        ):
             mlflow.log_params(params)
-            model = get_model(params, categorical=config['categorical'])
-            model.fit(X_train, y_train)
-            y_pred = model.predict(X_valid)
-            rmse = root_mean_squared_error(y_valid, y_pred)
+            model = get_model(
+                params,
+                categorical=_trial_data['config']['categorical'],
+                train_dir=train_dir,
+                thread_count=_trial_data['thread_count'],
+            )
+            with tracing.span('load_pools'):
+                train_pool, valid_pool = load_pools(
+                    _trial_data['pool_files'], _trial_data['config']
+                )
+            span.set(rows=train_pool.num_row())
+            start = time.perf_counter()
+            with tracing.span('fit', rows=train_pool.num_row()):
+                model.fit(
+                    train_pool,
+                    eval_set=valid_pool,
+                    early_stopping_rounds=_trial_data['early_stopping_rounds'],
+                )
+            fit_time = time.perf_counter() - start
+
+            # Validation RMSE of the best iteration, which use_best_model keeps
+            rmse = model.get_best_score()['validation']['RMSE']
             mlflow.log_metric("rmse", rmse)
+            mlflow.log_metric("best_iteration", model.get_best_iteration())
+            mlflow.log_metric("fit_time_s", fit_time)
+            span.set(rmse=rmse, run_id=run.info.run_id)
 
+            artefact_model_path = os.path.join(trial_dir, 'catboost_model.cbm')
             model.save_model(artefact_model_path)
-            mlflow.log_artifact(artefact_model_path, artifact_path="model")
-        return {'loss': rmse, 'status': STATUS_OK}
-
-    search_space = {
-        'iterations': hp.quniform('iterations', 100, 500, 50),
-        'learning_rate': hp.uniform('learning_rate', 0.01, 0.3),
-        'depth': hp.quniform('depth', 4, 10, 1),
-        'l2_leaf_reg': hp.uniform('l2_leaf_reg', 1, 10),
-    }
-
+    except BaseException:
+        shutil.rmtree(trial_dir, ignore_errors=True)
+        raise
+    finally:
+        # Trial worker processes exit without running atexit hooks
+        tracing.flush()
+    shutil.rmtree(train_dir, ignore_errors=True)
+    return rmse, run.info.run_id, artefact_model_path, trial_dir
+
+
+def run_parallel_trials(root_data_dir, num_trials, n_workers, rstate, top_models):
+    """TPE search keeping n_workers trials in flight, each in its own process.
+
+    A new point is suggested as soon as any trial finishes, from all results
+    known at that moment.
+    """
+    domain = Domain(lambda params: None, search_space)
+    trials = Trials()
+    running = {}
+
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_trial_worker,
+        initargs=(root_data_dir, config, split_cores(n_workers)),
+    ) as executor:
+        while len(trials) < num_trials or running:
+            while len(trials) < num_trials and len(running) < n_workers:
+                trials.refresh()
+                new_ids = trials.new_trial_ids(1)
+                docs = tpe.suggest(
+                    new_ids, domain, trials, rstate.integers(2**31 - 1)
+                )
+                trials.insert_trial_docs(docs)
+                doc = docs[0]
+                params = space_eval(
+                    search_space,
+                    {k: v[0] for k, v in doc['misc']['vals'].items() if v},
+                )
+                running[executor.submit(run_trial, doc['tid'], params)] = doc
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                doc = running.pop(future)
+                rmse, run_id, model_path, trial_dir = future.result()
+                top_models.offer(run_id, rmse, model_path, trial_dir)
+                doc['result'] = {'loss': rmse, 'status': STATUS_OK}
+                doc['state'] = JOB_STATE_DONE
+            trials.refresh()
+    return trials
+
+
+def run_optimization(
+    root_data_dir: str, num_trials: int, n_workers: int = 1, keep_top_k: int = 3
+):
     rstate = np.random.default_rng(42)  # for reproducible results
-    fmin(
-        fn=objective,
-        space=search_space,
-        algo=tpe.suggest,
-        max_evals=num_trials,
-        trials=Trials(),
-        rstate=rstate,
+    start = time.perf_counter()
+    # Quantize once up front; trial workers then only load the cached pools
+    cache_training_pools(root_data_dir, config)
+
+    # Leaving the with-block waits for every queued upload and deletion
+    with ArtifactUploader() as uploader:
+        top_models = TopKModels(keep_top_k, uploader)
+        if n_workers > 1:
+            trials = run_parallel_trials(
+                root_data_dir, num_trials, n_workers, rstate, top_models
+            )
+        else:
+            init_trial_worker(root_data_dir, config, thread_count=-1)
+            trial_ids = itertools.count()
+
+            def objective(params):
+                rmse, run_id, model_path, trial_dir = run_trial(
+                    next(trial_ids), params
+                )
+                top_models.offer(run_id, rmse, model_path, trial_dir)
+                return {'loss': rmse, 'status': STATUS_OK}
+
+            trials = Trials()
+            fmin(
+                fn=objective,
+                space=search_space,
+                algo=tpe.suggest,
+                max_evals=num_trials,
+                trials=trials,
+                rstate=rstate,
+            )
+        search_time = time.perf_counter() - start
+
+    print(
+        f"{len(trials.trials)} trials with {n_workers} worker(s) finished in "
+        f"{search_time:.1f}s (+{time.perf_counter() - start - search_time:.1f}s "
+        f"flushing uploads), best rmse {min(trials.losses()):.4f}"
     )
+    print(f"Kept models of runs: {top_models.run_ids()}")
+    best_trial = trials.best_trial
+    return {
+        'num_trials': len(trials.trials),
+        'best_rmse': best_trial['result']['loss'],
+        'kept_run_ids': top_models.run_ids(),
+    }
 
 
 if __name__ == '__main__':
     config = get_config(sys.argv[1])
-    run_optimization('/srv/data/', num_trials=15)
+    root_data_dir = '/srv/data/'
+    hpo_params = config.get('hyperopt', {})
+    StageCache(root_data_dir).run(
+        'hyperopt',
+        lambda: run_optimization(
+            root_data_dir,
+            num_trials=hpo_params.get('num_trials', 15),
+            n_workers=hpo_params.get('n_workers', 1),
+            keep_top_k=hpo_params.get('keep_top_k', 3),
+        ),
+        files=[
+            os.path.join(root_data_dir, 'train_dataset.csv'),
+            os.path.join(root_data_dir, 'valid_dataset.csv'),
+        ],
+        config=[config['categorical'], config['numerical'], hpo_params],
+        code=('hyperopt_params_search', 'pools'),
+        params={
+            'tracking_uri': mlflow.get_tracking_uri(),
+            'experiment_name': experiment_name,
+        },
+    )
@@ -10,4 +10,17 @@ def test_fastapi_api():
     response = httpx.post("http://127.0.0.1:8090/delivery_time", json=payload)
 
     assert response.status_code == 200
-    assert "delivery_time" in response.json()
\ No newline at end of file
+    assert "delivery_time" in response.json()
+
+
+def test_fastapi_api_customer_zip_code():
+    payload = {
+        "seller_zip_code_prefix": 9350,
+        "customer_zip_code_prefix": 1037,
+    }
+
+    response = httpx.post("http://127.0.0.1:8090/delivery_time", json=payload)
+
+    assert response.status_code == 200
+    assert "delivery_time" in response.json()
+    assert "customer_lat" in response.json()
@@ -0,0 +1,45 @@
+import os
+
+import psycopg
+import pytest
+
+# The docker-compose Postgres by default, any local instance through the env
+POSTGRES_URI = os.getenv(
+    'POSTGRES_TEST_URI', 'postgresql://db_user:db_password@db:5432/test'
+)
+
+
+def test_predict_batch_postgres():
+    rows = [
+        ('order1', 9350, -23.57698293467452, -46.58716127427677),
+        ('order2', 31842, -5.774190270584408, -35.271143276096765),
+        ('order3', 7112, -23.553522043896585, -50.54992367333536),
+        ('order4', 12940, -22.805706631753832, -43.42307905240664),
+    ]
+    with psycopg.connect(POSTGRES_URI, autocommit=True) as conn:
+        conn.execute('drop table if exists test_batch_orders')
+        conn.execute('drop table if exists test_batch_predictions')
+        conn.execute(
+            'create table test_batch_orders(order_id text, '
+            'seller_zip_code_prefix bigint, customer_lat numeric, customer_lng numeric)'
+        )
+        with conn.cursor() as cursor:
+            cursor.executemany(
+                'insert into test_batch_orders values (%s, %s, %s, %s)', rows
+            )
+
+    # batch_size=3 makes the server-side cursor return two batches
+    source = f'{POSTGRES_URI}?table=test_batch_orders&batch_size=3'
+    sink = f'{POSTGRES_URI}?table=test_batch_predictions&keys=order_id'
+    exit_code = os.system(
+        f"python src/predict_batch.py /srv/src/config.yml '{source}' '{sink}'"
+    )
+    assert exit_code == 0
+
+    with psycopg.connect(POSTGRES_URI) as conn:
+        result = conn.execute(
+            'select order_id, prediction from test_batch_predictions order by order_id'
+        ).fetchall()
+
+    assert [order_id for order_id, _ in result] == [row[0] for row in rows]
+    assert sum(prediction for _, prediction in result) == pytest.approx(39.62, abs=1e-2)
@@ -1,49 +1,125 @@
+import os
+from typing import List, Optional
+
+import numpy as np
 import pandas as pd
 from fastapi import FastAPI, HTTPException
-from catboost import CatBoostRegressor
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
+
+from features import add_delivery_features
+from geo_index import GeoIndex
+from model_store import load_model
+
+GEO_INDEX_DIR = os.getenv("GEO_INDEX_DIR", "/srv/data/geo_index")
+# CatBoost threads per prediction; serve.py sets it per worker, -1 uses all cores
+PREDICT_THREAD_COUNT = int(os.getenv("PREDICT_THREAD_COUNT", "-1"))
 
 app = FastAPI()
 
-model = CatBoostRegressor()
-model.load_model("/srv/data/prod_model.cbm")
+# models:/<name>@<alias> resolves through the registry and the local model cache
+model = load_model(os.getenv("MODEL_URI", "/srv/data/prod_model.cbm"))
+
+geo_index = GeoIndex.load(GEO_INDEX_DIR)
 
 
 class DeliveryTimeRequest(BaseModel):
     seller_zip_code_prefix: int
-    customer_lat: float
-    customer_lng: float
+    customer_zip_code_prefix: Optional[int] = None
+    customer_lat: Optional[float] = None
+    customer_lng: Optional[float] = None
+
+    @model_validator(mode="after")
+    def check_customer_location(self):
+        has_coordinates = self.customer_lat is not None and self.customer_lng is not None
+        if self.customer_zip_code_prefix is None and not has_coordinates:
+            raise ValueError(
+                "either customer_zip_code_prefix or customer_lat and customer_lng "
+                "must be provided"
+            )
+        return self
 
 
 class DeliveryTimeResponse(BaseModel):
     seller_zip_code_prefix: int
+    customer_zip_code_prefix: Optional[int] = None
     customer_lat: float
     customer_lng: float
+    delivery_distance_km: Optional[float] = None
     delivery_time: int
 
 
-@app.post("/delivery_time", response_model=DeliveryTimeResponse)
-async def delivery_time(request: DeliveryTimeRequest):
+def build_features(requests: List[DeliveryTimeRequest]):
+    """Column arrays for a list of requests, through the shared feature stage."""
+    customer_lat = np.array(
+        [np.nan if r.customer_lat is None else r.customer_lat for r in requests]
+    )
+    customer_lng = np.array(
+        [np.nan if r.customer_lng is None else r.customer_lng for r in requests]
+    )
+
+    # Requests without coordinates are resolved by customer ZIP prefix
+    missing = np.isnan(customer_lat) | np.isnan(customer_lng)
+    if missing.any():
+        customer_zip = np.array(
+            [r.customer_zip_code_prefix for r in requests], dtype=object
+        )[missing].astype(np.int64)
+        lat, lng = geo_index.lookup(customer_zip)
+        if np.isnan(lat).any():
+            unknown = sorted(set(customer_zip[np.isnan(lat)].tolist()))
+            raise HTTPException(
+                status_code=422,
+                detail=f"Unknown customer_zip_code_prefix: {unknown}",
+            )
+        customer_lat[missing] = lat
+        customer_lng[missing] = lng
+
+    features = {
+        "seller_zip_code_prefix": np.array(
+            [r.seller_zip_code_prefix for r in requests], dtype=np.int64
+        ),
+        "customer_lat": customer_lat,
+        "customer_lng": customer_lng,
+    }
+    return add_delivery_features(features, geo_index)
+
+
+def predict(requests: List[DeliveryTimeRequest]) -> List[DeliveryTimeResponse]:
+    features = build_features(requests)
     try:
-        X = pd.DataFrame(
-            [
-                {
-                    "seller_zip_code_prefix": request.seller_zip_code_prefix,
-                    "customer_lat": request.customer_lat,
-                    "customer_lng": request.customer_lng,
-                }
-            ]
-        )
-        predicted_delivery_time = int(round(model.predict(X)[0]))
+        X = pd.DataFrame(features)[model.feature_names_]
+        predicted_delivery_time = np.rint(
+            model.predict(X, thread_count=PREDICT_THREAD_COUNT)
+        ).astype(int)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
 
-        return DeliveryTimeResponse(
+    customer_lat = features["customer_lat"].tolist()
+    customer_lng = features["customer_lng"].tolist()
+    distance = features["delivery_distance_km"].tolist()
+    predicted_delivery_time = predicted_delivery_time.tolist()
+    return [
+        DeliveryTimeResponse(
             seller_zip_code_prefix=request.seller_zip_code_prefix,
-            customer_lat=request.customer_lat,
-            customer_lng=request.customer_lng,
-            delivery_time=predicted_delivery_time,
+            customer_zip_code_prefix=request.customer_zip_code_prefix,
+            customer_lat=customer_lat[i],
+            customer_lng=customer_lng[i],
+            delivery_distance_km=None if np.isnan(distance[i]) else distance[i],
+            delivery_time=predicted_delivery_time[i],
         )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) from e
+        for i, request in enumerate(requests)
+    ]
+
+
+@app.post("/delivery_time", response_model=DeliveryTimeResponse)
+async def delivery_time(request: DeliveryTimeRequest):
+    return predict([request])[0]
+
+
+@app.post("/delivery_time/batch", response_model=List[DeliveryTimeResponse])
+async def delivery_time_batch(requests: List[DeliveryTimeRequest]):
+    if not requests:
+        return []
+    return predict(requests)
 
 
 if __name__ == "__main__":
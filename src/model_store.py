@@ -0,0 +1,225 @@
+"""Model resolver with a local content-addressed artifact cache.
+
+Accepts `models:/<name>/<version>`, `models:/<name>@<alias>` or a plain file
+path. Registry models are downloaded once into `<cache dir>/objects/<sha256>.cbm`,
+and `refs/<name>/<version>` records which object a version resolved to. The
+cache is bounded in size with LRU eviction and guarded by a file lock, so
+serving replicas and batch jobs on one host can share it. Deserialized models
+are memoized per process by content hash.
+"""
+import os
+import re
+import glob
+import fcntl
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from catboost import CatBoostRegressor
+
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "/srv/data/model_cache")
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", 2 * 1024**3))
+DEFAULT_TRACKING_URI = "http://mlflow_container_ui:5000"
+
+MODEL_URI_RE = re.compile(
+    r'^models:/(?P<name>[^/@]+)(?:/(?P<version>\d+)|@(?P<alias>[\w-]+))$'
+)
+
+logger = logging.getLogger(__name__)
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def tracking_uri():
+    """MLflow server holding the registry; batch jobs don't configure MLflow themselves."""
+    return os.getenv("MLFLOW_TRACKING_URI", DEFAULT_TRACKING_URI)
+
+
+def parse_model_uri(model_uri):
+    """Split a registry URI into (name, version, alias), exactly one of the last two set."""
+    match = MODEL_URI_RE.match(model_uri)
+    if match is None:
+        raise ValueError(
+            f"Unsupported model URI {model_uri!r}, expected "
+            "models:/<name>/<version> or models:/<name>@<alias>"
+        )
+    return match.group('name'), match.group('version'), match.group('alias')
+
+
+class ModelCache:
+    def __init__(self, cache_dir=MODEL_CACHE_DIR, max_bytes=MODEL_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.refs_dir = os.path.join(cache_dir, 'refs')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.refs_dir, exist_ok=True)
+
+    @contextmanager
+    def lock(self, exclusive):
+        with open(os.path.join(self.cache_dir, '.lock'), 'a', encoding='utf-8') as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def object_path(self, sha):
+        return os.path.join(self.objects_dir, f'{sha}.cbm')
+
+    @contextmanager
+    def pinned(self, model_uri):
+        """Yield (local path, sha256) of a registry model, downloading it on a miss.
+
+        The lock it was resolved under is held until the block exits, so no
+        other process can evict the object while the caller reads it.
+        """
+        name, version, alias = parse_model_uri(model_uri)
+        if alias is not None:
+            version = self.resolve_alias(name, alias)
+
+        with self.lock(exclusive=False):
+            sha = self.hit(name, version)
+            if sha is not None:
+                yield self.object_path(sha), sha
+                return
+        with self.lock(exclusive=True):
+            # Another process may have fetched it while we waited
+            sha = self.hit(name, version) or self.download(name, version)
+            self.evict(keep=sha)
+            yield self.object_path(sha), sha
+
+    def resolve(self, model_uri):
+        """Return (local path, sha256) of a registry model, downloading it on a miss."""
+        with self.pinned(model_uri) as resolved:
+            return resolved
+
+    def resolve_alias(self, name, alias):
+        """Alias -> version from the registry, or the last known one if it is unreachable."""
+        from mlflow.tracking import MlflowClient
+
+        try:
+            version = (
+                MlflowClient(tracking_uri=tracking_uri())
+                .get_model_version_by_alias(name, alias)
+                .version
+            )
+        except Exception:
+            version = self.read_ref(name, f'@{alias}')
+            if version is None:
+                raise
+            logger.warning(
+                "Model registry unavailable, using cached %s@%s -> version %s",
+                name,
+                alias,
+                version,
+            )
+            return version
+        self.write_ref(name, f'@{alias}', str(version))
+        return str(version)
+
+    def hit(self, name, version):
+        sha = self.read_ref(name, version)
+        if sha is None or not os.path.exists(self.object_path(sha)):
+            return None
+        os.utime(self.object_path(sha))  # mtime is the LRU clock
+        return sha
+
+    def download(self, name, version):
+        import mlflow
+
+        logger.info("Downloading model %s version %s", name, version)
+        with tempfile.TemporaryDirectory(dir=self.cache_dir) as tmp_dir:
+            local_path = mlflow.artifacts.download_artifacts(
+                artifact_uri=f'models:/{name}/{version}',
+                dst_path=tmp_dir,
+                tracking_uri=tracking_uri(),
+            )
+            if os.path.isdir(local_path):
+                model_files = glob.glob(
+                    os.path.join(local_path, '**', '*.cbm'), recursive=True
+                )
+                if len(model_files) != 1:
+                    raise ValueError(
+                        f"Expected one .cbm file in {name} version {version}, "
+                        f"found {len(model_files)}"
+                    )
+                local_path = model_files[0]
+            sha = sha256_file(local_path)
+            if not os.path.exists(self.object_path(sha)):
+                os.replace(local_path, self.object_path(sha))
+        self.write_ref(name, version, sha)
+        return sha
+
+    def read_ref(self, name, key):
+        try:
+            with open(os.path.join(self.refs_dir, name, key), encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def write_ref(self, name, key, value):
+        ref_dir = os.path.join(self.refs_dir, name)
+        os.makedirs(ref_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            'w', dir=ref_dir, delete=False, encoding='utf-8'
+        ) as f:
+            f.write(value)
+        os.replace(f.name, os.path.join(ref_dir, key))
+
+    def evict(self, keep=None):
+        """Drop least recently used objects until the cache fits in max_bytes."""
+        objects = []
+        for entry in os.scandir(self.objects_dir):
+            stat = entry.stat()
+            objects.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in objects)
+        for _, size, path in sorted(objects):
+            if total <= self.max_bytes:
+                break
+            if keep is not None and path == self.object_path(keep):
+                continue
+            logger.info("Evicting cached model %s", os.path.basename(path))
+            os.remove(path)
+            total -= size
+
+
+def resolve_model(model_uri, cache=None):
+    """Return (local path, sha256) of a model URI or file path."""
+    if model_uri.startswith('models:/'):
+        return (cache or ModelCache()).resolve(model_uri)
+    return model_uri, sha256_file(model_uri)
+
+
+def load_model(model_uri, cache=None):
+    """Resolve a model URI or file path and return a memoized CatBoostRegressor."""
+    if model_uri.startswith('models:/'):
+        # Deserialize while the cache lock is held, so the object can't be evicted
+        with (cache or ModelCache()).pinned(model_uri) as (path, sha):
+            return _load_memoized(path, sha)
+    return _load_memoized(*resolve_model(model_uri))
+
+
+def _load_memoized(path, sha):
+    with _models_lock:
+        if sha not in _models:
+            model = CatBoostRegressor()
+            model.load_model(path)
+            _models[sha] = model
+        return _models[sha]
+
+
+def clear_memo():
+    with _models_lock:
+        _models.clear()
@@ -0,0 +1,163 @@
+"""Postgres source and sink for batch scoring.
+
+    postgresql://db_user:db_password@db:5432/test?table=orders
+    postgresql://db_user:db_password@db:5432/test?query=select+...&batch_size=10000
+    postgresql://db_user:db_password@db:5432/test?table=predictions&keys=order_id
+
+As a source, the rows of `table` or `query` are streamed through a
+server-side (named) cursor `batch_size` rows at a time, so memory stays flat
+whatever the size of the result. As a sink, every batch is appended to
+`table` with COPY ... FROM STDIN; the table is created from the dtypes of the
+first batch if it does not exist, and the rows are committed together when
+the writer closes. `keys` names source columns (e.g. an order id) to carry
+over to the sink next to the features and the prediction. `table`, `query`,
+`keys` and `batch_size` are read from the URI, every other parameter goes to
+libpq.
+"""
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import pandas as pd
+
+PG_SCHEMES = ('postgresql://', 'postgres://')
+URI_OPTIONS = ('table', 'query', 'keys', 'batch_size')
+DEFAULT_BATCH_SIZE = 50_000
+NUMERIC_OID = 1700  # arrives as decimal.Decimal, scored as float
+SOURCE_CURSOR_NAME = 'predict_batch_source'
+
+
+def is_postgres_uri(uri):
+    return uri.startswith(PG_SCHEMES)
+
+
+def parse_pg_uri(uri):
+    """Split a source/sink URI into (libpq conninfo, options)."""
+    parts = urlsplit(uri)
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    options = {key: value for key, value in params if key in URI_OPTIONS}
+    conninfo = urlunsplit(
+        parts._replace(
+            query=urlencode([(k, v) for k, v in params if k not in URI_OPTIONS])
+        )
+    )
+    options['batch_size'] = int(options.get('batch_size', DEFAULT_BATCH_SIZE))
+    options['keys'] = [key for key in options.get('keys', '').split(',') if key]
+    return conninfo, options
+
+
+def pg_column_types(df):
+    """Postgres column types for the columns of df."""
+    types = []
+    for name, dtype in df.dtypes.items():
+        if dtype.kind in 'iu':
+            pg_type = 'bigint'
+        elif dtype.kind == 'f':
+            pg_type = 'double precision'
+        elif dtype.kind == 'b':
+            pg_type = 'boolean'
+        elif dtype.kind == 'M':
+            pg_type = 'timestamp'
+        else:
+            pg_type = 'text'
+        types.append((name, pg_type))
+    return types
+
+
+def table_identifier(table):
+    from psycopg import sql
+
+    return sql.Identifier(*table.split('.'))
+
+
+def read_batches(uri, batch_size=None):
+    """Yield the rows of the source as DataFrames of at most batch_size rows."""
+    import psycopg
+    from psycopg import sql
+
+    conninfo, options = parse_pg_uri(uri)
+    batch_size = batch_size or options['batch_size']
+    if 'query' in options:
+        query = sql.SQL(options['query'])
+    elif 'table' in options:
+        query = sql.SQL('SELECT * FROM {}').format(table_identifier(options['table']))
+    else:
+        raise ValueError(f'{uri} needs a table= or query= parameter to read from')
+
+    with psycopg.connect(conninfo) as conn:
+        # A named cursor keeps the result on the server; it lives as long as
+        # the transaction that the connection opens implicitly here
+        with conn.cursor(name=SOURCE_CURSOR_NAME) as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(query)
+            columns = [column.name for column in cursor.description]
+            numeric = [
+                column.name
+                for column in cursor.description
+                if column.type_code == NUMERIC_OID
+            ]
+            while rows := cursor.fetchmany(batch_size):
+                df = pd.DataFrame.from_records(rows, columns=columns)
+                if numeric:
+                    df[numeric] = df[numeric].astype('float64')
+                yield df
+
+
+class PostgresWriter:
+    """Appends DataFrames to a table with COPY, committing on a clean exit."""
+
+    def __init__(self, uri):
+        self.conninfo, options = parse_pg_uri(uri)
+        if 'table' not in options:
+            raise ValueError(f'{uri} needs a table= parameter to write to')
+        self.table = options['table']
+        self.keys = options['keys']
+        self.rows = 0
+        self._conn = None
+        self._table_ready = False
+
+    def __enter__(self):
+        import psycopg
+
+        self._conn = psycopg.connect(self.conninfo)
+        return self
+
+    def create_table(self, df):
+        from psycopg import sql
+
+        self._conn.execute(
+            sql.SQL('CREATE TABLE IF NOT EXISTS {} ({})').format(
+                table_identifier(self.table),
+                sql.SQL(', ').join(
+                    sql.SQL('{} {}').format(sql.Identifier(name), sql.SQL(pg_type))
+                    for name, pg_type in pg_column_types(df)
+                ),
+            )
+        )
+        self._table_ready = True
+
+    def write(self, df):
+        from psycopg import sql
+
+        if not self._table_ready:
+            self.create_table(df)
+        statement = sql.SQL('COPY {} ({}) FROM STDIN (FORMAT csv)').format(
+            table_identifier(self.table),
+            sql.SQL(', ').join(sql.Identifier(name) for name in df.columns),
+        )
+        # One vectorized CSV chunk per batch instead of a Python call per row;
+        # NaN becomes an empty field, which COPY reads as NULL
+        with self._conn.cursor() as cursor:
+            with cursor.copy(statement) as copy:
+                copy.write(df.to_csv(header=False, index=False))
+        self.rows += len(df)
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self._conn.commit()
+            else:
+                self._conn.rollback()
+        finally:
+            self._conn.close()
+        if exc_type is None:
+            print(f'{self.rows} rows saved to {self.table}')
+        return False
@@ -0,0 +1,87 @@
+"""Quantized CatBoost train pool, built once per dataset and reused.
+
+Quantizing is the bulk of CatBoost's per-fit preprocessing, so the train pool
+is quantized with fixed border settings, saved in CatBoost's quantized binary
+format under a key of the input data hash, and loaded by every HPO trial and
+by the final training in register_model.
+
+The validation pool stays raw. A quantized pool saves only the float borders,
+so a validation pool quantized separately encodes the categorical features
+differently from the train pool and CatBoost scores most of its categories
+as unseen. A raw eval_set is encoded with the train pool's categories.
+"""
+import os
+import shutil
+
+import pandas as pd
+from catboost import Pool
+
+from utils import file_fingerprint, config_fingerprint
+
+QUANTIZATION_PARAMS = {'border_count': 254, 'feature_border_type': 'GreedyLogSum'}
+POOL_CACHE_DIR_NAME = 'pool_cache'
+TRAIN_POOL_FILE = 'train.quantized'
+
+
+def make_pool(df, config):
+    target = 'delivery_time'
+    return Pool(
+        df[config['categorical'] + config['numerical']],
+        label=df[target],
+        cat_features=config['categorical'],
+    )
+
+
+def build_training_pool(train_path, config, pools_dir):
+    train_pool = make_pool(pd.read_csv(train_path), config)
+    train_pool.quantize(**QUANTIZATION_PARAMS)
+    train_pool.save(os.path.join(pools_dir, TRAIN_POOL_FILE))
+
+
+def cache_training_pools(root_data_dir, config):
+    """Return (quantized train pool, validation CSV) files.
+
+    The train pool is quantized only on a cache miss.
+    """
+    train_path = os.path.join(root_data_dir, 'train_dataset.csv')
+    valid_path = os.path.join(root_data_dir, 'valid_dataset.csv')
+    key = config_fingerprint(
+        file_fingerprint(train_path),
+        config['categorical'],
+        config['numerical'],
+        QUANTIZATION_PARAMS,
+    )
+    pools_dir = os.path.join(root_data_dir, POOL_CACHE_DIR_NAME, key[:16])
+
+    if not os.path.isdir(pools_dir):
+        # Build next to the target and rename, so concurrent trial workers
+        # never load a half-written pool
+        tmp_dir = f'{pools_dir}.tmp-{os.getpid()}'
+        os.makedirs(tmp_dir, exist_ok=True)
+        try:
+            build_training_pool(train_path, config, tmp_dir)
+            os.rename(tmp_dir, pools_dir)
+        except OSError:
+            if not os.path.isdir(pools_dir):
+                raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return os.path.join(pools_dir, TRAIN_POOL_FILE), valid_path
+
+
+def load_pools(pool_files, config):
+    """Load (train, valid) pools; cheap, so each fit gets fresh Pool objects.
+
+    A loaded pool keeps temp files in the train_dir of the first fit that used
+    it, so reusing one Pool across fits with different train_dirs breaks.
+    """
+    train_file, valid_path = pool_files
+    return (
+        Pool(f'quantized://{train_file}'),
+        make_pool(pd.read_csv(valid_path), config),
+    )
+
+
+def get_training_pools(root_data_dir, config):
+    return load_pools(cache_training_pools(root_data_dir, config), config)
@@ -1,9 +1,15 @@
 import os
 import sys
 
-from catboost import CatBoostRegressor
+import pandas as pd
 
-from utils import read_data, save_data, get_config
+import tracing
+from pg_io import PostgresWriter, is_postgres_uri, read_batches
+from utils import read_data, save_data, get_config, config_fingerprint
+from model_store import load_model, resolve_model
+from stage_cache import StageCache, is_local_path
+from features import add_delivery_features
+from geo_index import GeoIndex, GEO_INDEX_DIR_NAME
 
 def get_features(df, config):
     categorical = config['categorical']
@@ -13,21 +19,97 @@ def get_features(df, config):
     y = df[target] if target in df.columns else None
     return X, y
 
-if __name__ == '__main__':
 
-    config = get_config(sys.argv[1])
+class CsvWriter:
+    """Collects scored batches and saves them as one CSV file on a clean exit."""
+
+    keys = []
+
+    def __init__(self, path):
+        self.path = path
+        self.frames = []
+
+    def __enter__(self):
+        return self
+
+    def write(self, df):
+        self.frames.append(df)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and self.frames:
+            df = pd.concat(self.frames, ignore_index=True)
+            with tracing.span('save_data', rows=len(df)):
+                save_data(df, self.path)
+        return False
+
+
+def open_source(data_path):
+    if is_postgres_uri(data_path):
+        return read_batches(data_path)
+    return iter([read_data(data_path, start_dt=None, end_dt=None)])
+
 
-    model_file_name = config['model_file_name']
-    model_path = os.path.join('/srv/data', model_file_name)
+def open_sink(output_data_path):
+    if is_postgres_uri(output_data_path):
+        return PostgresWriter(output_data_path)
+    return CsvWriter(output_data_path)
 
-    model = CatBoostRegressor()
-    model.load_model(model_path)
+
+def score(df, model, geo_index, config, keys=()):
+    with tracing.span('features', rows=len(df)):
+        df = add_delivery_features(df, geo_index)
+        X, _ = get_features(df, config)
+    with tracing.span('model.predict', rows=len(X)):
+        y_pred = model.predict(X)
+    return pd.concat([df[list(keys)], X], axis=1).assign(prediction=y_pred)
+
+
+@tracing.traced()
+def predict_batch(config, model_uri, data_path, output_data_path, data_dir='/srv/data'):
+    """Score data_path into output_data_path, batch by batch for Postgres sources."""
+    with tracing.span('load_model'):
+        model = load_model(model_uri)
+        geo_index = GeoIndex.load(os.path.join(data_dir, GEO_INDEX_DIR_NAME))
+
+    batches = open_source(data_path)
+    num_rows = 0
+    with open_sink(output_data_path) as sink:
+        while True:
+            with tracing.span('read_data') as span:
+                df = next(batches, None)
+                span.set(rows=0 if df is None else len(df))
+            if df is None:
+                break
+            predictions = score(df, model, geo_index, config, keys=sink.keys)
+            with tracing.span('write_data', rows=len(predictions)):
+                sink.write(predictions)
+            num_rows += len(predictions)
+    return num_rows
+
+
+if __name__ == '__main__':
+
+    config = get_config(sys.argv[1])
+    model_uri = os.getenv('MODEL_URI', config['model_uri'])
 
     data_path = sys.argv[2]
     output_data_path = sys.argv[3]
 
-    df = read_data(data_path, start_dt=None, end_dt=None)
-    X, _ = get_features(df, config)
-    y_pred = model.predict(X)
-    X['prediction'] = y_pred
-    save_data(X, output_data_path)
+    if not (is_local_path(data_path) and is_local_path(output_data_path)):
+        # Remote files and tables can't be fingerprinted cheaply, always recompute
+        predict_batch(config, model_uri, data_path, output_data_path)
+        sys.exit()
+
+    _, model_sha = resolve_model(model_uri)
+    StageCache('/srv/data').run(
+        f'predict-{config_fingerprint(os.path.abspath(output_data_path))[:12]}',
+        lambda: predict_batch(config, model_uri, data_path, output_data_path),
+        files=[
+            data_path,
+            os.path.join('/srv/data', GEO_INDEX_DIR_NAME, 'meta.json'),
+        ],
+        config=[config['categorical'], config['numerical']],
+        code=('predict_batch', 'features', 'geo_index', 'utils'),
+        params={'model_sha256': model_sha},
+        outputs=[output_data_path],
+    )
@@ -1,103 +1,127 @@
 import os
-import pandas as pd
 
+import pandas as pd
 from prefect import flow, task, get_run_logger
-from utils import get_config, filter_df_by_date
-
+from prefect.task_runners import ThreadPoolTaskRunner
+
+from utils import get_config, file_fingerprint
+from geo_index import GeoIndex, GEO_INDEX_DIR_NAME
+from stage_cache import StageCache
+from prepare_data import (
+    MERGE_TABLES,
+    DATASET_FILES,
+    PREPARE_CODE,
+    load_geo_index,
+    load_dataset,
+    merge_datasets,
+    split_train_valid,
+    merge_stage_config,
+    split_stage_config,
+)
+
+
+def dataset_cache_key(context, parameters):
+    path = os.path.join(parameters['dataset_dir'], DATASET_FILES[parameters['name']])
+    return f"dataset-{parameters['name']}-{file_fingerprint(path)}"
+
+
+@task(cache_key_fn=dataset_cache_key, persist_result=True)
+def load_csv(dataset_dir: str, name: str) -> pd.DataFrame:
+    logger = get_run_logger()
+    df = load_dataset(dataset_dir, name)
+    logger.info(f"Loaded {name}: {df.shape[0]} rows")
+    return df
 
 
 @task
-def load_and_merge_data(config_path: str) -> pd.DataFrame:
+def prepare_geo_index(dataset_dir: str, index_dir: str) -> str:
     logger = get_run_logger()
-    cfg = get_config(config_path)
-    dataset_dir = os.path.join(cfg['prefect_root_data_dir'], 'dataset')
-    date_start = cfg['data_params']['date_start']
-    date_end = cfg['data_params']['date_end']
+    geo_index = load_geo_index(dataset_dir, index_dir)
+    logger.info(f"ZIP-prefix index ready at {index_dir}: {len(geo_index)} prefixes")
+    return index_dir
 
-    orders_dataset = pd.read_csv(os.path.join(dataset_dir, 'olist_orders_dataset.csv'))
-    orders_dataset['purchase_dt'] = pd.to_datetime(
-        orders_dataset['order_purchase_timestamp'].str[:10]
-    )
 
-    orders_filtered = filter_df_by_date(
-        orders_dataset,
-        dt_col='order_purchase_timestamp',
-        date_filter={'start_date': date_start, 'end_date': date_end},
-    )
-
-    orders_filtered['delivery_time'] = (
-        pd.to_datetime(orders_filtered['order_delivered_customer_date']) -
-        pd.to_datetime(orders_filtered['order_purchase_timestamp'])
-    ).dt.days
-
-    threshold = orders_filtered['delivery_time'].quantile(0.95)
-    orders_filtered = orders_filtered[orders_filtered['delivery_time'] <= threshold]
-
-    sellers = pd.read_csv(os.path.join(dataset_dir, 'olist_sellers_dataset.csv'))
-    customers = pd.read_csv(os.path.join(dataset_dir, 'olist_customers_dataset.csv'))
-    items = pd.read_csv(os.path.join(dataset_dir, 'olist_order_items_dataset.csv'))
-    locations = pd.read_csv(os.path.join(dataset_dir, 'olist_geolocation_dataset.csv'))
-
-    locations = (
-        locations.groupby('geolocation_zip_code_prefix')[['geolocation_lat', 'geolocation_lng']]
-        .mean()
-        .reset_index()
-    )
+# Merge and split are memoized by StageCache with the same keys as
+# prepare_data.run_prepare_stages, so a run is skipped only while the files
+# it wrote are still on disk unchanged
+@task
+def merge_data(
+    stage_cache_dir: str,
+    dataset_dir: str,
+    data_params: dict,
+    output_path: str,
+    tables: dict,
+    index_dir: str,
+) -> str:
+    logger = get_run_logger()
 
-    df = (
-        orders_filtered
-        .merge(items[['order_id', 'price', 'seller_id', 'product_id']], on='order_id')
-        .merge(sellers[['seller_id', 'seller_zip_code_prefix']], on='seller_id')
-        .merge(customers[['customer_id', 'customer_zip_code_prefix']], on='customer_id')
-        .merge(
-            locations.rename(columns={
-                'geolocation_zip_code_prefix': 'customer_zip_code_prefix',
-                'geolocation_lat': 'customer_lat',
-                'geolocation_lng': 'customer_lng',
-            }),
-            on='customer_zip_code_prefix'
+    def merge():
+        df = merge_datasets(
+            tables,
+            GeoIndex.load(index_dir),
+            data_params['date_start'],
+            data_params['date_end'],
         )
+        df.to_csv(output_path, index=False)
+        logger.info(f"Merged dataset saved to {output_path}")
+        return output_path
+
+    return StageCache(stage_cache_dir).run(
+        'merge',
+        merge,
+        files=[os.path.join(dataset_dir, name) for name in DATASET_FILES.values()],
+        config=merge_stage_config(data_params),
+        code=PREPARE_CODE,
+        outputs=[output_path],
     )
 
-    df = df[[
-        'seller_zip_code_prefix',
-        'customer_lat',
-        'customer_lng',
-        'delivery_time',
-        'purchase_dt'
-    ]]
-
-    output_path = os.path.join(cfg['prefect_root_data_dir'], 'prefect', 'merged_dataset.csv')
-    df.to_csv(output_path, index=False)
-    logger.info(f"Merged dataset saved to {output_path}")
-    return output_path
-
 
 @task
-def split_train_valid(path: str, config_path: str):
+def split_data(stage_cache_dir: str, path: str, data_params: dict, output_dir: str):
     logger = get_run_logger()
-    cfg = get_config(config_path)
-    df = pd.read_csv(path)
-    dt_col = 'purchase_dt'
-
-    train_start = cfg['data_params']['train_date_start']
-    train_end = cfg['data_params']['train_date_end']
-    valid_start = cfg['data_params']['valid_date_start']
-    valid_end = cfg['data_params']['valid_date_end']
+    train_path = os.path.join(output_dir, 'train_dataset.csv')
+    valid_path = os.path.join(output_dir, 'valid_dataset.csv')
+
+    def split():
+        train_df, valid_df = split_train_valid(pd.read_csv(path), data_params)
+        train_df.to_csv(train_path, index=False)
+        valid_df.to_csv(valid_path, index=False)
+        logger.info(f"Train and valid datasets saved to: {train_path}, {valid_path}")
+        return [train_path, valid_path]
+
+    return StageCache(stage_cache_dir).run(
+        'split',
+        split,
+        files=[path],
+        config=split_stage_config(data_params),
+        code=('prepare_data',),
+        outputs=[train_path, valid_path],
+    )
 
-    train_path = os.path.join(cfg['prefect_root_data_dir'], 'prefect', 'train_dataset.csv')
-    valid_path = os.path.join(cfg['prefect_root_data_dir'], 'prefect', 'valid_dataset.csv')
 
-    df[(df[dt_col] >= train_start) & (df[dt_col] <= train_end)].to_csv(train_path, index=False)
-    df[(df[dt_col] >= valid_start) & (df[dt_col] <= valid_end)].to_csv(valid_path, index=False)
+@flow(
+    name="Prepare Data",
+    task_runner=ThreadPoolTaskRunner(max_workers=len(MERGE_TABLES) + 1),
+)
+def prefect_prepare_data_flow(config_path: str = "src/config.yml"):
+    cfg = get_config(config_path)
+    data_params = cfg['data_params']
+    dataset_dir = os.path.join(cfg['prefect_root_data_dir'], 'dataset')
+    output_dir = os.path.join(cfg['prefect_root_data_dir'], 'prefect')
+    index_dir = os.path.join(cfg['prefect_root_data_dir'], GEO_INDEX_DIR_NAME)
+    os.makedirs(output_dir, exist_ok=True)
 
-    logger.info(f"Train and valid datasets saved to: {train_path}, {valid_path}")
+    merged_path = os.path.join(output_dir, 'merged_dataset.csv')
 
+    # CSV loads are independent, so the task runner reads them concurrently
+    tables = {name: load_csv.submit(dataset_dir, name) for name in MERGE_TABLES}
+    index = prepare_geo_index.submit(dataset_dir, index_dir)
 
-@flow(name="Prepare Data")
-def prefect_prepare_data_flow(config_path: str = "src/config.yml"):
-    merged = load_and_merge_data(config_path)
-    split_train_valid(merged, config_path)
+    merged = merge_data.submit(
+        output_dir, dataset_dir, data_params, merged_path, tables, index
+    )
+    split = split_data.submit(output_dir, merged, data_params, output_dir)
+    return split.result()
 
 
 if __name__ == "__main__":
@@ -4,7 +4,61 @@ import sys
 import numpy as np
 import pandas as pd
 
-from utils import get_config, filter_df_by_date
+import tracing
+from utils import get_config, file_fingerprint, filter_df_by_date
+from features import add_delivery_features
+from geo_index import GeoIndex, GEO_INDEX_DIR_NAME, INDEX_FILES
+from stage_cache import StageCache
+
+DATASET_FILES = {
+    'orders': 'olist_orders_dataset.csv',
+    'items': 'olist_order_items_dataset.csv',
+    'sellers': 'olist_sellers_dataset.csv',
+    'customers': 'olist_customers_dataset.csv',
+    'locations': 'olist_geolocation_dataset.csv',
+}
+MERGE_TABLES = ('orders', 'items', 'sellers', 'customers')
+
+
+def load_dataset(dataset_dir, name):
+    df = pd.read_csv(os.path.join(dataset_dir, DATASET_FILES[name]))
+    if name == 'orders':
+        df['purchase_dt'] = pd.to_datetime(df['order_purchase_timestamp'].str[:10])
+    return df
+
+
+def load_datasets(dataset_dir, names=MERGE_TABLES):
+    return {name: load_dataset(dataset_dir, name) for name in names}
+
+
+def build_geo_index(locations_df, source=None):
+    centroids = (
+        locations_df.groupby('geolocation_zip_code_prefix')[
+            ['geolocation_lat', 'geolocation_lng']
+        ]
+        .mean()
+        .reset_index()
+    )
+    return GeoIndex.from_centroids(
+        centroids['geolocation_zip_code_prefix'].to_numpy(),
+        centroids['geolocation_lat'].to_numpy(),
+        centroids['geolocation_lng'].to_numpy(),
+        source=source,
+    )
+
+
+def load_geo_index(dataset_dir, index_dir):
+    """Open the persisted ZIP-prefix index, rebuilding it when the geolocation CSV changed."""
+    source = file_fingerprint(os.path.join(dataset_dir, DATASET_FILES['locations']))
+    if os.path.exists(os.path.join(index_dir, 'meta.json')):
+        geo_index = GeoIndex.load(index_dir)
+        if geo_index.source == source:
+            return geo_index
+
+    build_geo_index(load_dataset(dataset_dir, 'locations'), source=source).save(
+        index_dir
+    )
+    return GeoIndex.load(index_dir)
 
 
 def preprocess_orders(df, filter_threshold=None):
@@ -18,40 +72,14 @@ def preprocess_orders(df, filter_threshold=None):
     return df
 
 
-def prepare_data(root_dir, start_date, end_date, dataset_dir=None):
-    result_csv_path = os.path.join(root_dir, 'merged_dataset.csv')
-
-    if os.path.exists(result_csv_path):
-        return result_csv_path
-
-    orders_dataset = pd.read_csv(os.path.join(dataset_dir, 'olist_orders_dataset.csv'))
-    orders_dataset['purchase_dt'] = pd.to_datetime(
-        orders_dataset['order_purchase_timestamp'].apply(lambda x: x[:10])
-    )
-
+def merge_datasets(tables, geo_index, start_date, end_date):
+    """Build the modelling dataset from the raw tables returned by load_datasets."""
     orders_filtered_df = filter_df_by_date(
-        orders_dataset,
+        tables['orders'],
         dt_col='order_purchase_timestamp',
         date_filter={'start_date': start_date, 'end_date': end_date},
     )
     orders_filtered_df = preprocess_orders(orders_filtered_df)
-    #
-    sellers_df = pd.read_csv(os.path.join(dataset_dir, 'olist_sellers_dataset.csv'))
-    customers_df = pd.read_csv(os.path.join(dataset_dir, 'olist_customers_dataset.csv'))
-    locations_df = pd.read_csv(
-        os.path.join(dataset_dir, 'olist_geolocation_dataset.csv')
-    )
-    orders_items_dataset = pd.read_csv(
-        os.path.join(dataset_dir, 'olist_order_items_dataset.csv')
-    )
-
-    locations_df = (
-        locations_df.groupby('geolocation_zip_code_prefix')[
-            ['geolocation_lat', 'geolocation_lng']
-        ]
-        .mean()
-        .reset_index()
-    )
 
     delivery_df = (
         orders_filtered_df[
@@ -65,71 +93,136 @@ def prepare_data(root_dir, start_date, end_date, dataset_dir=None):
             ]
         ]
         .merge(
-            orders_items_dataset[['order_id', 'price', 'seller_id', 'product_id']],
+            tables['items'][['order_id', 'price', 'seller_id', 'product_id']],
             on='order_id',
         )
-        .merge(sellers_df[['seller_id', 'seller_zip_code_prefix']], on='seller_id')
         .merge(
-            customers_df[['customer_id', 'customer_zip_code_prefix']], on='customer_id'
+            tables['sellers'][['seller_id', 'seller_zip_code_prefix']], on='seller_id'
         )
         .merge(
-            locations_df[
-                ['geolocation_zip_code_prefix', 'geolocation_lat', 'geolocation_lng']
-            ].rename(
-                columns={
-                    'geolocation_zip_code_prefix': 'customer_zip_code_prefix',
-                    'geolocation_lat': 'customer_lat',
-                    'geolocation_lng': 'customer_lng'
-                }
-            ),
-            on='customer_zip_code_prefix',
+            tables['customers'][['customer_id', 'customer_zip_code_prefix']],
+            on='customer_id',
         )
-
     )
-    delivery_df = delivery_df[[
+    delivery_df = add_delivery_features(delivery_df, geo_index)
+    delivery_df = delivery_df[delivery_df['customer_lat'].notna()]
+    return delivery_df[[
         'seller_zip_code_prefix',
+        'customer_zip_code_prefix',
+        'seller_lat',
+        'seller_lng',
         'customer_lat',
         'customer_lng',
+        'delivery_distance_km',
         'delivery_time',
         'purchase_dt'
     ]]
-    
-    delivery_df.to_csv(result_csv_path, index=False)
+
+
+def split_train_valid(df, data_params, dt_col='purchase_dt'):
+    dt = df[dt_col].astype(str).str[:10]
+
+    mask = (dt >= data_params['train_date_start']) & (dt <= data_params['train_date_end'])
+    train_df = df[mask]
+
+    mask = (dt >= data_params['valid_date_start']) & (dt <= data_params['valid_date_end'])
+    valid_df = df[mask]
+    return train_df, valid_df
+
+
+PREPARE_CODE = ('prepare_data', 'features', 'geo_index', 'utils')
+
+
+def merge_stage_config(data_params):
+    """The merge reads only the overall date range."""
+    return [data_params['date_start'], data_params['date_end']]
+
+
+def split_stage_config(data_params):
+    """The split reads only the train_*/valid_* dates; changing them skips the merge."""
+    return [
+        {k: v for k, v in data_params.items() if k.startswith(('train_', 'valid_'))}
+    ]
+
+
+@tracing.traced()
+def prepare_data(root_dir, start_date, end_date, dataset_dir=None):
+    result_csv_path = os.path.join(root_dir, 'merged_dataset.csv')
+    with tracing.span('load_geo_index') as span:
+        geo_index = load_geo_index(
+            dataset_dir, os.path.join(root_dir, GEO_INDEX_DIR_NAME)
+        )
+        span.set(rows=len(geo_index))
+    with tracing.span('read_csv') as span:
+        tables = load_datasets(dataset_dir)
+        span.set(rows=sum(len(df) for df in tables.values()))
+    with tracing.span('merge_datasets') as span:
+        delivery_df = merge_datasets(tables, geo_index, start_date, end_date)
+        span.set(rows=len(delivery_df))
+    with tracing.span('write_csv', rows=len(delivery_df)):
+        delivery_df.to_csv(result_csv_path, index=False)
     return result_csv_path
 
 
+@tracing.traced()
 def prepare_train_test(input_csv_path, config):
     train_csv_path = os.path.join(config['root_data_dir'], 'train_dataset.csv')
     valid_csv_path = os.path.join(config['root_data_dir'], 'valid_dataset.csv')
-    if os.path.exists(train_csv_path) and os.path.exists(valid_csv_path):
-        print("Train and validation datasets already exist. Skipping split.")
-        return
-    else:
-        print("Generating new train/valid datasets...")
-    df = pd.read_csv(input_csv_path)
-    dt_col = 'purchase_dt'
-
-    dt_start = config['data_params']['train_date_start']
-    dt_end = config['data_params']['train_date_end']
-
-    mask = (df[dt_col] >= dt_start) | (df[dt_col] <= dt_end)
-    df[mask].to_csv(train_csv_path, index=False)
-
-    dt_start = config['data_params']['valid_date_start']
-    dt_end = config['data_params']['valid_date_end']
-    mask = (df[dt_col] >= dt_start) | (df[dt_col] >= dt_end)
-    df[mask].to_csv(valid_csv_path, index=False)
+    print("Generating new train/valid datasets...")
+    with tracing.span('read_csv') as span:
+        df = pd.read_csv(input_csv_path)
+        span.set(rows=len(df))
+    with tracing.span('split_train_valid'):
+        train_df, valid_df = split_train_valid(df, config['data_params'])
+    with tracing.span('write_csv', rows=len(train_df) + len(valid_df)):
+        train_df.to_csv(train_csv_path, index=False)
+        valid_df.to_csv(valid_csv_path, index=False)
     print('Train test split complited')
+    return train_csv_path, valid_csv_path
+
+
+def run_prepare_stages(cfg, dataset_dir, stage_cache=None):
+    """Merge and split, each skipped while its inputs are unchanged."""
+    root_dir = cfg['root_data_dir']
+    data_params = cfg['data_params']
+    stage_cache = stage_cache or StageCache(root_dir)
+
+    result_path = os.path.join(root_dir, 'merged_dataset.csv')
+    # The merge also builds the ZIP-prefix index that predict_batch, the
+    # backfill and the API image read, so a missing index reruns it too
+    index_paths = [
+        os.path.join(root_dir, GEO_INDEX_DIR_NAME, name) for name in INDEX_FILES
+    ]
+    stage_cache.run(
+        'merge',
+        lambda: prepare_data(
+            root_dir,
+            data_params['date_start'],
+            data_params['date_end'],
+            dataset_dir=dataset_dir,
+        ),
+        files=[os.path.join(dataset_dir, name) for name in DATASET_FILES.values()],
+        config=merge_stage_config(data_params),
+        code=PREPARE_CODE,
+        outputs=[result_path] + index_paths,
+    )
+
+    split_paths = [
+        os.path.join(root_dir, 'train_dataset.csv'),
+        os.path.join(root_dir, 'valid_dataset.csv'),
+    ]
+    stage_cache.run(
+        'split',
+        lambda: prepare_train_test(result_path, config=cfg),
+        files=[result_path],
+        config=split_stage_config(data_params),
+        code=('prepare_data',),
+        outputs=split_paths,
+    )
+    return split_paths
 
 
 if __name__ == '__main__':
     cfg = get_config(sys.argv[1])
     dataset_directory = os.path.join(cfg['root_data_dir'], 'dataset')
-
-    date_start = cfg['data_params']['date_start']
-    date_end = cfg['data_params']['date_end']
-    result_path = prepare_data(
-        cfg['root_data_dir'], date_start, date_end, dataset_dir=dataset_directory
-    )
-
-    prepare_train_test(result_path, config=cfg)
+    run_prepare_stages(cfg, dataset_directory)
@@ -2,11 +2,12 @@ import os
 import sys
 
 import mlflow
-import pandas as pd
 from mlflow.entities import ViewType
 from mlflow.tracking import MlflowClient
 
+from pools import get_training_pools
 from utils import get_config, train_and_save_model
+from stage_cache import StageCache
 
 HPO_EXPERIMENT_NAME = "catboost-params-new"
 
@@ -30,20 +31,25 @@ def convert_params(params_dict):
     return converted
 
 
-def train_best_model(data_path, cfg, out_model_path):
+def find_best_run(client):
     top_n = 5
-    client = MlflowClient()
     experiment = client.get_experiment_by_name(HPO_EXPERIMENT_NAME)
 
     if experiment is None:
         raise RuntimeError(f"Experiment '{HPO_EXPERIMENT_NAME}' not found")
 
-    run = client.search_runs(
+    return client.search_runs(
         experiment_ids=experiment.experiment_id,
         run_view_type=ViewType.ACTIVE_ONLY,
         max_results=top_n,
         order_by=["metrics.rmse ASC"],
     )[0]
+
+
+def train_best_model(root_data_dir, cfg, out_model_path, run=None):
+    client = MlflowClient()
+    if run is None:
+        run = find_best_run(client)
     run_id = run.info.run_id
     best_params_dict = convert_params(run.data.params)
 
@@ -51,20 +57,61 @@ def train_best_model(data_path, cfg, out_model_path):
     print("Best run ID:", run.info.run_id)
 
     with mlflow.start_run(run_id=run_id):
-        train_df = pd.read_csv(data_path)
-        train_and_save_model(train_df, cfg, best_params_dict, out_model_path)
-
-        mlflow.log_artifact(out_model_path, artifact_path="model")
-        model_uri = f"runs:/{run_id}/model"
-        mlflow.register_model(model_uri, name="catboost-best-model")
-
-    print('model logged and registered')
+        train_pool, valid_pool = get_training_pools(root_data_dir, cfg)
+        model = train_and_save_model(
+            train_pool,
+            cfg,
+            best_params_dict,
+            out_model_path,
+            eval_set=valid_pool,
+            early_stopping_rounds=cfg.get('hyperopt', {}).get('early_stopping_rounds'),
+        )
+        mlflow.log_metric("final_best_iteration", model.get_best_iteration())
+
+        # "model" may already hold this run's HPO trial model; the registered
+        # version must contain exactly one .cbm for the model cache to resolve
+        mlflow.log_artifact(out_model_path, artifact_path="registered_model")
+        model_uri = f"runs:/{run_id}/registered_model"
+        registry = cfg['model_registry']
+        model_version = mlflow.register_model(model_uri, name=registry['name'])
+
+    # Consumers resolve models:/<name>@<alias>, moving the alias promotes the version
+    client.set_registered_model_alias(
+        registry['name'], registry['alias'], model_version.version
+    )
+    print(
+        f"model logged and registered as {registry['name']} "
+        f"version {model_version.version} (@{registry['alias']})"
+    )
+    return {'run_id': run_id, 'version': model_version.version}
 
 
 if __name__ == '__main__':
     config = get_config(sys.argv[1])
     root_data_dir = '/srv/data/'
     model_path = os.path.join('/srv/data', config['model_file_name'])
-    train_data_path = os.path.join(root_data_dir, 'train_dataset.csv')
 
-    train_best_model(train_data_path, config, model_path)
+    best_run = find_best_run(MlflowClient())
+
+    # Retrain only when the best run, the training data or the config changed
+    StageCache(root_data_dir).run(
+        'register',
+        lambda: train_best_model(root_data_dir, config, model_path, run=best_run),
+        files=[
+            os.path.join(root_data_dir, 'train_dataset.csv'),
+            os.path.join(root_data_dir, 'valid_dataset.csv'),
+        ],
+        config=[
+            config['categorical'],
+            config['numerical'],
+            config.get('hyperopt', {}).get('early_stopping_rounds'),
+            config['model_registry'],
+        ],
+        code=('register_model', 'pools', 'utils'),
+        params={
+            'tracking_uri': mlflow.get_tracking_uri(),
+            'run_id': best_run.info.run_id,
+            'run_params': best_run.data.params,
+        },
+        outputs=[model_path],
+    )
@@ -0,0 +1,573 @@
+"""Offline benchmark suite for prepare_data, predict_batch, backfill, HPO and the API.
+
+For every scale factor a synthetic Olist dataset is generated into a scratch
+directory, and each benchmark runs in a fresh spawned process, so the peak
+RSS it reports belongs to that step alone. Nothing needs the docker-compose
+stack: the model is a small CatBoost stand-in trained on the synthetic split,
+the API runs under uvicorn in-process on a free local port, and backfill
+metrics go to an in-memory cursor instead of Postgres. The pre-fork server
+(serve.py) is also measured as a separate process from 1 worker up to the
+core count. With --hpo-workers, the hyperparameter search is timed for each
+number of parallel trial workers against a local file-based MLflow store.
+
+Results are written as JSON; pass --baseline with an earlier results file to
+flag regressions.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import logging
+import argparse
+import platform
+import resource
+import threading
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cpus import available_cpus
+from utils import get_config
+from synthetic_olist import generate_dataset
+
+STAND_IN_PARAMS = {'iterations': 200, 'depth': 6, 'learning_rate': 0.1}
+# Headline metrics compared against a baseline; True means higher is better
+COMPARED_METRICS = {
+    'total_s': False,
+    'peak_rss_mb': False,
+    'rows_per_s': True,
+    'mean_window_s': False,
+    'p50_ms': False,
+    'p99_ms': False,
+    'rps': True,
+    'trials_per_min': True,
+    'worker_uss_mb': False,
+    'total_pss_mb': False,
+}
+
+
+def in_subprocess(fn, *args):
+    """Run fn(*args) in a fresh spawned process and return its result."""
+    with ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context('spawn')
+    ) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def peak_rss_mb():
+    """Peak RSS of this process.
+
+    VmHWM belongs to the current address space, whereas ru_maxrss of a spawned
+    process also carries the peak of the parent it was forked from.
+    """
+    try:
+        with open('/proc/self/status', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def count_rows(csv_path):
+    with open(csv_path, 'rb') as f:
+        return sum(1 for _ in f) - 1
+
+
+def bench_prepare(work_dir, config):
+    from prepare_data import prepare_data, prepare_train_test
+
+    data_params = config['data_params']
+    baseline_rss = peak_rss_mb()
+
+    start = time.perf_counter()
+    merged_path = prepare_data(
+        work_dir,
+        data_params['date_start'],
+        data_params['date_end'],
+        dataset_dir=os.path.join(work_dir, 'dataset'),
+    )
+    merge_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prepare_train_test(merged_path, {**config, 'root_data_dir': work_dir})
+    split_time = time.perf_counter() - start
+
+    return {
+        'rows': count_rows(merged_path),
+        'merge_s': merge_time,
+        'split_s': split_time,
+        'total_s': merge_time + split_time,
+        'baseline_rss_mb': baseline_rss,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def train_stand_in_model(work_dir, config):
+    from catboost import CatBoostRegressor
+
+    train_df = pd.read_csv(os.path.join(work_dir, 'train_dataset.csv'))
+    features = config['categorical'] + config['numerical']
+    model = CatBoostRegressor(
+        cat_features=config['categorical'],
+        verbose=0,
+        allow_writing_files=False,
+        **STAND_IN_PARAMS,
+    )
+    model.fit(train_df[features], train_df['delivery_time'])
+    model_path = os.path.join(work_dir, 'model.cbm')
+    model.save_model(model_path)
+    return model_path
+
+
+def bench_predict(work_dir, config, model_path, repeats=3):
+    from predict_batch import predict_batch
+
+    data_path = os.path.join(work_dir, 'merged_dataset.csv')
+    output_path = os.path.join(work_dir, 'predictions.csv')
+
+    # The first run also pays for loading the model
+    timings = []
+    for _ in range(repeats + 1):
+        start = time.perf_counter()
+        rows = predict_batch(
+            config, model_path, data_path, output_path, data_dir=work_dir
+        )
+        timings.append(time.perf_counter() - start)
+
+    best = min(timings[1:])
+    return {
+        'rows': rows,
+        'first_run_s': timings[0],
+        'best_s': best,
+        'rows_per_s': rows / best,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+class RecordingCursor:
+    """Stand-in for the monitoring database cursor."""
+
+    def __init__(self):
+        self.rows = []
+
+    def execute(self, query, params=None):
+        self.rows.append(params)
+
+
+def bench_backfill(work_dir, config, model_path):
+    try:
+        from batch_prediction_backfill import run_backfill
+    except ImportError as e:
+        return {'skipped': f'backfill dependencies are missing: {e}'}
+
+    cursor = RecordingCursor()
+    start = time.perf_counter()
+    windows = run_backfill(
+        config, model_path, data_dir=work_dir, metrics_cursor=cursor
+    )
+    total = time.perf_counter() - start
+    window_times = [window['seconds'] for window in windows]
+    return {
+        'windows': len(windows),
+        'rows': sum(window['num_rows'] for window in windows),
+        'total_s': total,
+        'mean_window_s': float(np.mean(window_times)) if windows else 0.0,
+        'max_window_s': max(window_times, default=0.0),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def load_payloads(work_dir, limit=1000):
+    valid_df = pd.read_csv(os.path.join(work_dir, 'valid_dataset.csv'))
+    return (
+        valid_df[['seller_zip_code_prefix', 'customer_zip_code_prefix']]
+        .head(limit)
+        .to_dict(orient='records')
+    )
+
+
+async def run_load(url, payloads, concurrency, num_requests):
+    import httpx
+
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    latencies = []
+    next_request = iter(range(num_requests))
+
+    async def worker(client):
+        for i in next_request:
+            start = time.perf_counter()
+            response = await client.post(url, json=payloads[i % len(payloads)])
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        for payload in payloads[:10]:  # warm up the connection pool and model
+            (await client.post(url, json=payload)).raise_for_status()
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'requests': num_requests,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'rps': num_requests / elapsed,
+    }
+
+
+def bench_hpo(work_dir, config, n_workers, num_trials):
+    """Wall time of a hyperparameter search keeping n_workers trials in flight."""
+    # Must be set before the import, which connects to the tracking server;
+    # spawned trial workers inherit them
+    os.environ['MLFLOW_TRACKING_URI'] = f"file:{os.path.join(work_dir, 'mlruns')}"
+    os.environ['MLFLOW_ARTIFACT_LOCATION'] = os.path.join(work_dir, 'mlartifacts')
+    import hyperopt_params_search
+
+    hyperopt_params_search.config = config
+    start = time.perf_counter()
+    summary = hyperopt_params_search.run_optimization(
+        work_dir, num_trials=num_trials, n_workers=n_workers
+    )
+    total = time.perf_counter() - start
+    return {
+        'n_workers': n_workers,
+        'thread_count': hyperopt_params_search.split_cores(n_workers),
+        'num_trials': summary['num_trials'],
+        'total_s': total,
+        'trials_per_min': summary['num_trials'] / total * 60,
+        'best_rmse': summary['best_rmse'],
+    }
+
+
+def bench_api(work_dir, model_path, concurrency_levels, num_requests):
+    import uvicorn
+
+    os.environ['MODEL_URI'] = model_path
+    os.environ['GEO_INDEX_DIR'] = os.path.join(work_dir, 'geo_index')
+    import main  # loads the model and the index at import
+
+    payloads = load_payloads(work_dir)
+
+    port = free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(main.app, host='127.0.0.1', port=port, log_level='warning')
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    try:
+        url = f'http://127.0.0.1:{port}/delivery_time'
+        results = {
+            f'concurrency_{concurrency}': asyncio.run(
+                run_load(url, payloads, concurrency, num_requests)
+            )
+            for concurrency in concurrency_levels
+        }
+    finally:
+        server.should_exit = True
+        thread.join()
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def process_memory_mb(pid):
+    """RSS, PSS and USS of a process in MB; PSS splits shared pages between sharers."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup', encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss_mb': fields['Rss'],
+        'pss_mb': fields['Pss'],
+        'uss_mb': fields['Private_Clean'] + fields['Private_Dirty'],
+    }
+
+
+def child_pids(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', encoding='utf-8') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # ppid is the second field after the parenthesised command name
+        if int(stat.rsplit(')', 1)[1].split()[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def wait_until_ready(url, payload, timeout=60):
+    import httpx
+
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.post(url, json=payload).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f'{url} did not come up in {timeout}s')
+
+
+def default_worker_counts(cpu_count=None):
+    """1, 2, 4, ... up to the core count, which is always included."""
+    cpu_count = cpu_count or available_cpus()
+    counts = [1]
+    while counts[-1] * 2 < cpu_count:
+        counts.append(counts[-1] * 2)
+    return sorted(set(counts + [cpu_count]))
+
+
+def bench_serving(work_dir, model_path, worker_counts, concurrency, num_requests):
+    """RPS, latency and memory of the pre-fork server (serve.py) per worker count."""
+    payloads = load_payloads(work_dir)
+    serve_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py')
+    env = {
+        **os.environ,
+        'MODEL_URI': model_path,
+        'GEO_INDEX_DIR': os.path.join(work_dir, 'geo_index'),
+    }
+    results = {}
+    for workers in worker_counts:
+        port = free_port()
+        url = f'http://127.0.0.1:{port}/delivery_time'
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                serve_script,
+                '--host', '127.0.0.1',
+                '--port', str(port),
+                '--workers', str(workers),
+                '--log-level', 'warning',
+            ],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_until_ready(url, payloads[0])
+            stats = asyncio.run(run_load(url, payloads, concurrency, num_requests))
+            # Measured after serving, so pages the workers dirtied are counted
+            master = process_memory_mb(server.pid)
+            worker_memory = [process_memory_mb(pid) for pid in child_pids(server.pid)]
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+
+        results[f'workers_{workers}'] = {
+            **stats,
+            'concurrency': concurrency,
+            'master_rss_mb': master['rss_mb'],
+            'worker_rss_mb': float(np.mean([m['rss_mb'] for m in worker_memory])),
+            'worker_uss_mb': float(np.mean([m['uss_mb'] for m in worker_memory])),
+            'total_pss_mb': master['pss_mb'] + sum(m['pss_mb'] for m in worker_memory),
+        }
+    return results
+
+
+def run_scale(scale, config, work_dir, args):
+    print(f"Scale {scale}x: generating dataset in {work_dir}")
+    os.makedirs(work_dir, exist_ok=True)
+    start = time.perf_counter()
+    tables = in_subprocess(
+        generate_dataset, os.path.join(work_dir, 'dataset'), scale
+    )
+    results = {
+        'tables': tables,
+        'generate_s': time.perf_counter() - start,
+    }
+
+    results['prepare_data'] = in_subprocess(bench_prepare, work_dir, config)
+    print(f"  prepare_data: {results['prepare_data']['total_s']:.2f}s")
+
+    model_path = in_subprocess(train_stand_in_model, work_dir, config)
+
+    results['predict_batch'] = in_subprocess(
+        bench_predict, work_dir, config, model_path
+    )
+    print(f"  predict_batch: {results['predict_batch']['rows_per_s']:.0f} rows/s")
+
+    if args.hpo_workers:
+        results['hpo'] = {}
+        for n_workers in args.hpo_workers:
+            stats = in_subprocess(
+                bench_hpo, work_dir, config, n_workers, args.hpo_trials
+            )
+            stats['speedup'] = (
+                results['hpo'][f'workers_{args.hpo_workers[0]}']['total_s']
+                / stats['total_s']
+                if results['hpo']
+                else 1.0
+            )
+            results['hpo'][f'workers_{n_workers}'] = stats
+            print(
+                f"  hpo {n_workers} worker(s): {stats['total_s']:.1f}s for "
+                f"{stats['num_trials']} trials, {stats['speedup']:.2f}x"
+            )
+
+    results['backfill'] = in_subprocess(bench_backfill, work_dir, config, model_path)
+    if 'skipped' in results['backfill']:
+        print(f"  backfill: skipped, {results['backfill']['skipped']}")
+    else:
+        print(f"  backfill: {results['backfill']['mean_window_s']:.3f}s per window")
+
+    if not args.skip_api:
+        results['api'] = in_subprocess(
+            bench_api, work_dir, model_path, args.concurrency, args.requests
+        )
+        for level, stats in results['api'].items():
+            if isinstance(stats, dict):
+                print(
+                    f"  api {level}: p50 {stats['p50_ms']:.1f}ms "
+                    f"p99 {stats['p99_ms']:.1f}ms {stats['rps']:.0f} rps"
+                )
+
+        results['serving'] = bench_serving(
+            work_dir,
+            model_path,
+            args.serve_workers or default_worker_counts(),
+            max(args.concurrency),
+            args.requests,
+        )
+        for level, stats in results['serving'].items():
+            print(
+                f"  serve.py {level}: {stats['rps']:.0f} rps, "
+                f"p99 {stats['p99_ms']:.1f}ms, {stats['worker_uss_mb']:.0f}MB "
+                f"private per worker, {stats['total_pss_mb']:.0f}MB PSS in total"
+            )
+    return results
+
+
+def run_metadata(args):
+    import catboost
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'available_cpus': available_cpus(),
+        'versions': {
+            'catboost': catboost.__version__,
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+        },
+        'scales': args.scales,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+    }
+
+
+def flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{name}.'))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare_results(baseline, current, tolerance):
+    """Return (metric, baseline, current) for metrics worse by more than tolerance."""
+    baseline_flat = flatten(baseline['results'])
+    regressions = []
+    for name, value in flatten(current['results']).items():
+        metric = name.rsplit('.', 1)[-1]
+        old = baseline_flat.get(name)
+        if metric not in COMPARED_METRICS or not old:
+            continue
+        change = value / old - 1
+        worse = -change if COMPARED_METRICS[metric] else change
+        if worse > tolerance:
+            regressions.append((name, old, value))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--config', default=os.path.join(os.path.dirname(__file__), 'config.yml')
+    )
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--skip-api', action='store_true')
+    parser.add_argument('--serve-workers', type=int, nargs='+', default=None)
+    parser.add_argument('--hpo-workers', type=int, nargs='+', default=None)
+    parser.add_argument('--hpo-trials', type=int, default=12)
+    parser.add_argument('--work-dir', default=None)
+    parser.add_argument('--keep-data', action='store_true')
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    config = get_config(args.config)
+    bench_dir = os.path.join(config['root_data_dir'], 'benchmarks')
+    work_root = args.work_dir or os.path.join(bench_dir, 'work')
+
+    report = {'meta': run_metadata(args), 'results': {}}
+    for scale in args.scales:
+        work_dir = os.path.join(work_root, f'scale_{scale:g}x')
+        try:
+            report['results'][f'{scale:g}x'] = run_scale(scale, config, work_dir, args)
+        finally:
+            if not args.keep_data:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(
+        bench_dir, f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_results(json.load(f), report, args.tolerance)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: {old:.4g} -> {new:.4g}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
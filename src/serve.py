@@ -0,0 +1,171 @@
+"""Pre-fork production server for the delivery time API.
+
+The master process imports `main`, which loads the CatBoost model and the
+ZIP-prefix index, freezes the garbage collector so collections in the workers
+don't write to the shared object pages, binds the listening socket and forks
+the workers. Each worker runs its own uvicorn event loop on the inherited
+socket and shares the model pages with the master copy-on-write. CatBoost
+prediction threads per worker are cores // workers, so workers and model
+threads don't oversubscribe the CPU.
+
+A worker that dies is replaced, with a growing delay when workers keep dying
+right after start. SIGTERM/SIGINT shut the workers down gracefully and then
+stop the master.
+
+    python src/serve.py --host 0.0.0.0 --port 8090 --workers 4
+"""
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+
+import uvicorn
+
+from cpus import available_cpus
+
+logger = logging.getLogger(__name__)
+
+CRASH_LOOP_WINDOW_S = 5
+MAX_RESTART_DELAY_S = 30
+GRACEFUL_SHUTDOWN_S = 30
+
+
+def worker_thread_count(workers, cpu_count=None):
+    return max(1, (cpu_count or available_cpus()) // workers)
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Master:
+    def __init__(self, app_module, sock, workers, thread_count, log_level='info'):
+        self.app_module = app_module
+        self.sock = sock
+        self.num_workers = workers
+        self.thread_count = thread_count
+        self.log_level = log_level
+        self.workers = {}  # pid -> start time
+        self.stopping = False
+        self._restart_delay = 0
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self.run_worker()
+            except BaseException:  # pylint: disable=broad-except
+                logger.exception("Worker %d failed", os.getpid())
+                code = 1
+            finally:
+                # Never return into the master's loop from a forked child
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+        logger.info("Started worker %d", pid)
+
+    def run_worker(self):
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.SIG_DFL)  # uvicorn installs its own
+        self.app_module.PREDICT_THREAD_COUNT = self.thread_count
+        server = uvicorn.Server(
+            uvicorn.Config(
+                self.app_module.app,
+                log_level=self.log_level,
+                access_log=False,
+                timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_S,
+            )
+        )
+        server.run(sockets=[self.sock])
+
+    def stop(self, signum, frame):
+        if self.stopping:
+            return
+        logger.info("Received %s, stopping workers", signal.Signals(signum).name)
+        self.stopping = True
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.num_workers):
+            self.spawn()
+
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.workers.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+
+            logger.warning(
+                "Worker %d exited with code %s, restarting",
+                pid,
+                os.waitstatus_to_exitcode(status),
+            )
+            if time.monotonic() - started < CRASH_LOOP_WINDOW_S:
+                self._restart_delay = min(
+                    max(1, self._restart_delay * 2), MAX_RESTART_DELAY_S
+                )
+                time.sleep(self._restart_delay)
+            else:
+                self._restart_delay = 0
+            if not self.stopping:
+                self.spawn()
+        logger.info("All workers stopped")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=int(os.getenv('WEB_CONCURRENCY', available_cpus())),
+    )
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=args.log_level.upper(), format="%(asctime)s [%(levelname)s]: %(message)s"
+    )
+
+    import main as app_module  # loads the model and the index once, in the master
+
+    # Objects allocated so far stay out of future collections, so workers don't
+    # touch (and copy) their pages just by running the GC
+    gc.collect()
+    gc.freeze()
+
+    thread_count = worker_thread_count(args.workers)
+    logger.info(
+        "Serving on %s:%d with %d workers, %d CatBoost threads each",
+        args.host,
+        args.port,
+        args.workers,
+        thread_count,
+    )
+    sock = bind_socket(args.host, args.port)
+    Master(
+        app_module, sock, args.workers, thread_count, log_level=args.log_level
+    ).run()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
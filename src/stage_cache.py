@@ -0,0 +1,100 @@
+"""Hash-keyed memoization of pipeline stages.
+
+A stage key is a fingerprint of everything the stage reads: its data files,
+the config sections it uses, the source of the modules that implement it and
+any extra params. `<root>/stage_cache/<stage>.json` records the key of the
+last run, the fingerprints of the files it produced and an optional JSON
+result. A stage is skipped only when its key matches and its outputs are
+still on disk unchanged. Downstream keys include the fingerprints of upstream
+outputs, so a change recomputes exactly the stages that depend on it.
+
+Set STAGE_CACHE_REFRESH to a comma-separated list of stage names (or `all`)
+to force them to run.
+"""
+import os
+import json
+import logging
+import importlib.util
+
+from utils import file_fingerprint, config_fingerprint
+
+STAGE_CACHE_DIR_NAME = 'stage_cache'
+
+logger = logging.getLogger(__name__)
+
+
+def code_fingerprint(*modules):
+    """Fingerprint of the source files of the given modules."""
+    return {
+        name: file_fingerprint(importlib.util.find_spec(name).origin)
+        for name in modules
+    }
+
+
+def is_local_path(path):
+    return '://' not in path
+
+
+class StageCache:
+    def __init__(self, root_dir, refresh=None):
+        self.manifest_dir = os.path.join(root_dir, STAGE_CACHE_DIR_NAME)
+        if refresh is None:
+            refresh = os.getenv('STAGE_CACHE_REFRESH', '')
+        self.refresh = {name.strip() for name in refresh.split(',') if name.strip()}
+
+    def manifest_path(self, stage):
+        return os.path.join(self.manifest_dir, f'{stage}.json')
+
+    @staticmethod
+    def key(files=(), config=(), code=(), params=None):
+        return config_fingerprint(
+            {path: file_fingerprint(path) for path in files},
+            list(config),
+            code_fingerprint(*code),
+            params,
+        )
+
+    def lookup(self, stage, key):
+        """Return (hit, result) for a stage run under key."""
+        if stage in self.refresh or 'all' in self.refresh:
+            return False, None
+        try:
+            with open(self.manifest_path(stage), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False, None
+        if manifest['key'] != key:
+            return False, None
+        for path, fingerprint in manifest['outputs'].items():
+            if not os.path.exists(path) or file_fingerprint(path) != fingerprint:
+                return False, None
+        return True, manifest['result']
+
+    def store(self, stage, key, outputs=(), result=None):
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        manifest = {
+            'key': key,
+            'outputs': {path: file_fingerprint(path) for path in outputs},
+            'result': result,
+        }
+        tmp_path = f'{self.manifest_path(stage)}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path(stage))
+
+    def run(self, stage, fn, files=(), config=(), code=(), params=None, outputs=()):
+        """Call fn() unless the stage already ran with the same inputs.
+
+        `outputs` are the files fn() writes; fn's return value must be JSON
+        serializable and is what a cache hit returns.
+        """
+        key = self.key(files=files, config=config, code=code, params=params)
+        hit, result = self.lookup(stage, key)
+        if hit:
+            logger.info("Stage %s is up to date (key %s), skipping", stage, key[:12])
+            return result
+
+        logger.info("Running stage %s (key %s)", stage, key[:12])
+        result = fn()
+        self.store(stage, key, outputs=outputs, result=result)
+        return result
@@ -0,0 +1,152 @@
+"""Synthetic Olist-shaped CSVs for benchmarks and offline runs.
+
+Writes the five tables prepare_data reads, with the same file names and
+columns as the Kaggle dataset. Scale 1 is about a tenth of the public dataset
+(10k orders, 100k geolocation rows) and every table grows linearly with the
+scale factor; only the number of ZIP prefixes is capped at the real count.
+Customers and sellers cluster around Sao Paulo like the real data, and
+delivery time grows with the seller-customer distance, so a model trained on
+it has signal.
+"""
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from features import haversine_km
+from prepare_data import DATASET_FILES
+
+BASE_ORDERS = 10_000
+MAX_ZIP_PREFIXES = 19_000
+GEO_ROWS_PER_ORDER = 10
+PURCHASE_START = '2016-10-01'
+PURCHASE_END = '2018-08-31'
+STATES = np.array(['SP', 'RJ', 'MG', 'RS', 'PR', 'SC', 'BA', 'DF', 'GO', 'ES'])
+
+
+def make_zip_centroids(rng, n_zip):
+    """ZIP prefixes with centroids: 70% around Sao Paulo, the rest across Brazil."""
+    zip_codes = np.sort(rng.choice(np.arange(1000, 99991), n_zip, replace=False))
+    near_sp = rng.random(n_zip) < 0.7
+    lat = np.where(
+        near_sp, rng.normal(-23.5, 1.5, n_zip), rng.uniform(-33.0, -3.0, n_zip)
+    )
+    lng = np.where(
+        near_sp, rng.normal(-46.6, 1.5, n_zip), rng.uniform(-73.0, -35.0, n_zip)
+    )
+    return zip_codes, lat, lng
+
+
+def make_tables(scale=1, seed=42):
+    rng = np.random.default_rng(seed)
+    n_orders = int(BASE_ORDERS * scale)
+    n_sellers = max(100, n_orders * 3 // 100)
+    n_zip = min(MAX_ZIP_PREFIXES, max(500, n_orders // 5))
+
+    zip_codes, zip_lat, zip_lng = make_zip_centroids(rng, n_zip)
+    geo_rows = n_orders * GEO_ROWS_PER_ORDER
+    geo_zip = np.arange(geo_rows) % n_zip
+    locations = pd.DataFrame({
+        'geolocation_zip_code_prefix': zip_codes[geo_zip],
+        'geolocation_lat': zip_lat[geo_zip] + rng.normal(0, 0.02, geo_rows),
+        'geolocation_lng': zip_lng[geo_zip] + rng.normal(0, 0.02, geo_rows),
+        'geolocation_city': 'city',
+        'geolocation_state': STATES[geo_zip % len(STATES)],
+    })
+
+    seller_zip = rng.integers(0, n_zip, n_sellers)
+    sellers = pd.DataFrame({
+        'seller_id': np.char.add('seller', np.arange(n_sellers).astype(str)),
+        'seller_zip_code_prefix': zip_codes[seller_zip],
+        'seller_city': 'city',
+        'seller_state': STATES[seller_zip % len(STATES)],
+    })
+
+    # One customer_id per order, as in the public dataset
+    customer_zip = rng.integers(0, n_zip, n_orders)
+    customer_ids = np.char.add('customer', np.arange(n_orders).astype(str))
+    customers = pd.DataFrame({
+        'customer_id': customer_ids,
+        'customer_unique_id': customer_ids,
+        'customer_zip_code_prefix': zip_codes[customer_zip],
+        'customer_city': 'city',
+        'customer_state': STATES[customer_zip % len(STATES)],
+    })
+
+    # Popular sellers get most orders; items per order is mostly 1
+    order_seller = np.minimum(rng.zipf(1.5, n_orders) - 1, n_sellers - 1)
+    rng.shuffle(order_seller)
+    distance = haversine_km(
+        zip_lat[seller_zip[order_seller]],
+        zip_lng[seller_zip[order_seller]],
+        zip_lat[customer_zip],
+        zip_lng[customer_zip],
+    )
+    delivery_days = rng.gamma(2.0, 3.0, n_orders) + distance / 150.0
+
+    start = np.datetime64(PURCHASE_START, 's').astype(np.int64)
+    end = np.datetime64(PURCHASE_END, 's').astype(np.int64)
+    purchase = pd.to_datetime(rng.integers(start, end, n_orders), unit='s')
+    delivered = purchase + pd.to_timedelta(delivery_days * 86400, unit='s')
+    status = np.where(rng.random(n_orders) < 0.97, 'delivered', 'shipped')
+    order_ids = np.char.add('order', np.arange(n_orders).astype(str))
+    orders = pd.DataFrame({
+        'order_id': order_ids,
+        'customer_id': customer_ids,
+        'order_status': status,
+        'order_purchase_timestamp': purchase.astype(str),
+        'order_approved_at': (purchase + pd.Timedelta(hours=1)).astype(str),
+        'order_delivered_carrier_date': (purchase + pd.Timedelta(days=2)).astype(str),
+        'order_delivered_customer_date': np.where(
+            status == 'delivered', delivered.floor('s').astype(str), ''
+        ),
+        'order_estimated_delivery_date': (purchase + pd.Timedelta(days=24))
+        .normalize()
+        .astype(str),
+    })
+
+    items_per_order = np.minimum(rng.geometric(0.88, n_orders), 5)
+    item_order = np.repeat(np.arange(n_orders), items_per_order)
+    n_items = len(item_order)
+    item_seq = np.arange(n_items) - np.repeat(
+        np.cumsum(items_per_order) - items_per_order, items_per_order
+    )
+    items = pd.DataFrame({
+        'order_id': order_ids[item_order],
+        'order_item_id': item_seq + 1,
+        'product_id': np.char.add(
+            'product', rng.integers(0, 30_000, n_items).astype(str)
+        ),
+        'seller_id': sellers['seller_id'].to_numpy()[order_seller[item_order]],
+        'shipping_limit_date': orders['order_approved_at'].to_numpy()[item_order],
+        'price': rng.lognormal(4.3, 0.9, n_items).round(2),
+        'freight_value': rng.lognormal(2.8, 0.5, n_items).round(2),
+    })
+
+    return {
+        'orders': orders,
+        'items': items,
+        'sellers': sellers,
+        'customers': customers,
+        'locations': locations,
+    }
+
+
+def generate_dataset(dataset_dir, scale=1, seed=42):
+    """Write the Olist CSVs into dataset_dir, returns row counts per table."""
+    os.makedirs(dataset_dir, exist_ok=True)
+    tables = make_tables(scale, seed)
+    for name, df in tables.items():
+        df.to_csv(os.path.join(dataset_dir, DATASET_FILES[name]), index=False)
+    return {name: len(df) for name, df in tables.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('dataset_dir')
+    parser.add_argument('--scale', type=float, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(sys.argv[1:])
+    print(generate_dataset(args.dataset_dir, args.scale, args.seed))
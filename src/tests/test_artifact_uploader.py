@@ -0,0 +1,39 @@
+from artifact_uploader import TopKModels
+
+
+class FakeFuture:
+    def __init__(self, started):
+        self.started = started
+
+    def cancel(self):
+        return not self.started
+
+
+class FakeUploader:
+    def __init__(self):
+        self.uploaded = []
+        self.deleted = []
+
+    def upload(self, run_id, local_path, artifact_path=None, cleanup_dir=None):
+        self.uploaded.append(run_id)
+        # the first upload is already in flight, the rest are still queued
+        return FakeFuture(started=len(self.uploaded) == 1)
+
+    def delete(self, run_id, artifact_path, after=None):
+        self.deleted.append(run_id)
+
+
+def test_top_k_models(tmp_path):
+    uploader = FakeUploader()
+    top_models = TopKModels(2, uploader)
+
+    assert top_models.offer('a', 3.0, 'a.cbm', tmp_path / 'a')
+    assert top_models.offer('b', 2.0, 'b.cbm', tmp_path / 'b')
+    assert not top_models.offer('c', 4.0, 'c.cbm', tmp_path / 'c')
+    assert top_models.offer('d', 1.0, 'd.cbm', tmp_path / 'd')
+    assert top_models.offer('e', 1.5, 'e.cbm', tmp_path / 'e')
+
+    assert top_models.run_ids() == ['d', 'e']
+    assert uploader.uploaded == ['a', 'b', 'd', 'e']
+    # 'a' was already uploading, so it is deleted; queued 'b' is just cancelled
+    assert uploader.deleted == ['a']
@@ -0,0 +1,37 @@
+from synthetic_olist import make_tables
+from run_benchmarks import compare_results
+from prepare_data import build_geo_index, merge_datasets
+
+
+def test_synthetic_tables_feed_prepare_data():
+    tables = make_tables(scale=0.1, seed=1)
+    assert len(tables['orders']) == 1000
+    assert len(tables['locations']) == 10_000
+    assert set(tables['items']['order_id']) <= set(tables['orders']['order_id'])
+
+    orders = tables['orders']
+    orders['purchase_dt'] = orders['order_purchase_timestamp'].str[:10]
+    df = merge_datasets(
+        tables, build_geo_index(tables['locations']), '2017-01-01', '2017-12-31'
+    )
+    assert len(df) > 0
+    assert df['delivery_distance_km'].notna().all()
+    assert df[['delivery_distance_km', 'delivery_time']].corr().iloc[0, 1] > 0.3
+
+
+def test_compare_results():
+    baseline = {'results': {'1x': {
+        'prepare_data': {'total_s': 1.0, 'rows': 10},
+        'api': {'concurrency_1': {'rps': 100.0, 'p99_ms': 10.0}},
+    }}}
+    current = {'results': {'1x': {
+        'prepare_data': {'total_s': 1.1, 'rows': 20},
+        'api': {'concurrency_1': {'rps': 50.0, 'p99_ms': 20.0}},
+    }}}
+
+    regressions = compare_results(baseline, current, tolerance=0.2)
+
+    assert [name for name, _, _ in regressions] == [
+        '1x.api.concurrency_1.rps',
+        '1x.api.concurrency_1.p99_ms',
+    ]
@@ -0,0 +1,19 @@
+import os
+
+import cpus
+
+
+def test_available_cpus_uses_affinity_and_cgroup_quota(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, 'sched_getaffinity', lambda pid: set(range(8)))
+    monkeypatch.setattr(os, 'cpu_count', lambda: 32)
+    cpu_max = tmp_path / 'cpu.max'
+    monkeypatch.setattr(cpus, 'CGROUP_CPU_MAX', str(cpu_max))
+
+    cpu_max.write_text('max 100000\n')
+    assert cpus.available_cpus() == 8
+
+    cpu_max.write_text('200000 100000\n')  # docker --cpus=2
+    assert cpus.available_cpus() == 2
+
+    cpu_max.unlink()
+    assert cpus.available_cpus() == 8
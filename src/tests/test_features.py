@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from features import haversine_km, add_delivery_features
+from geo_index import GeoIndex
+
+
+def test_haversine_km():
+    # Sao Paulo -> Rio de Janeiro
+    distance = haversine_km(
+        np.array([-23.5505, -23.5505]),
+        np.array([-46.6333, -46.6333]),
+        np.array([-22.9068, -23.5505]),
+        np.array([-43.1729, -46.6333]),
+    )
+    assert distance.dtype == np.float32
+    assert distance[0] == pytest.approx(360.7, abs=0.5)
+    assert distance[1] == 0
+
+
+def test_add_delivery_features():
+    geo_index = GeoIndex.from_centroids(
+        np.array([1037, 9350]),
+        np.array([-23.55, -23.57]),
+        np.array([-46.63, -46.58]),
+    )
+    df = pd.DataFrame({
+        'seller_zip_code_prefix': [9350, 9350, 12345],
+        'customer_zip_code_prefix': [1037, 9350, 1037],
+    })
+
+    df = add_delivery_features(df, geo_index)
+
+    assert df['customer_lat'].tolist() == pytest.approx([-23.55, -23.57, -23.55])
+    assert df['delivery_distance_km'][0] == pytest.approx(5.6, abs=0.1)
+    assert df['delivery_distance_km'][1] == 0
+    assert np.isnan(df['delivery_distance_km'][2])
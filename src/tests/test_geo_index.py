@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from geo_index import GeoIndex
+
+
+def test_geo_index_lookup(tmp_path):
+    geo_index = GeoIndex.from_centroids(
+        np.array([31842, 9350, 12940]),
+        np.array([-5.77, -23.57, -22.80]),
+        np.array([-35.27, -46.58, -43.42]),
+        source='test',
+    )
+    geo_index.save(tmp_path)
+
+    loaded = GeoIndex.load(tmp_path)
+    assert loaded.source == 'test'
+    assert isinstance(loaded.zip_codes, np.memmap)
+    assert loaded.zip_codes.tolist() == [9350, 12940, 31842]
+
+    lat, lng = loaded.lookup(np.array([12940, 1, 31842, 99999]))
+    np.testing.assert_allclose(lat[[0, 2]], [-22.80, -5.77], atol=1e-5)
+    np.testing.assert_allclose(lng[[0, 2]], [-43.42, -35.27], atol=1e-5)
+    assert np.isnan(lat[[1, 3]]).all()
+
+    assert loaded.get(9350) == pytest.approx((-23.57, -46.58), abs=1e-5)
+    assert loaded.get(9351) is None
+    assert loaded.get(99999) is None
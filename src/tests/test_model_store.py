@@ -0,0 +1,124 @@
+import os
+from contextlib import contextmanager
+
+import mlflow
+import numpy as np
+import pandas as pd
+import pytest
+from catboost import CatBoostRegressor
+from mlflow.tracking import MlflowClient
+
+import model_store
+from model_store import ModelCache, load_model, parse_model_uri
+
+
+@pytest.fixture
+def registered_model(tmp_path, monkeypatch):
+    monkeypatch.setenv('MLFLOW_TRACKING_URI', f'file://{tmp_path / "mlruns"}')
+    mlflow.set_tracking_uri(f'file://{tmp_path / "mlruns"}')
+    model_store.clear_memo()
+
+    model_path = tmp_path / 'model.cbm'
+    X = pd.DataFrame({'x': np.arange(20.0)})
+    CatBoostRegressor(iterations=5, verbose=0, allow_writing_files=False).fit(
+        X, X['x']
+    ).save_model(str(model_path))
+
+    with mlflow.start_run() as run:
+        mlflow.log_artifact(str(model_path), artifact_path='registered_model')
+    version = mlflow.register_model(
+        f'runs:/{run.info.run_id}/registered_model', name='delivery'
+    ).version
+    MlflowClient().set_registered_model_alias('delivery', 'champion', version)
+    yield version
+    mlflow.set_tracking_uri(None)
+    model_store.clear_memo()
+
+
+def test_parse_model_uri():
+    assert parse_model_uri('models:/delivery/3') == ('delivery', '3', None)
+    assert parse_model_uri('models:/delivery@champion') == ('delivery', None, 'champion')
+    with pytest.raises(ValueError):
+        parse_model_uri('runs:/abc/model')
+
+
+def test_load_model_from_registry(tmp_path, registered_model, monkeypatch):
+    cache = ModelCache(tmp_path / 'cache')
+    model = load_model('models:/delivery@champion', cache=cache)
+    assert os.listdir(cache.objects_dir) == [f'{cache.read_ref("delivery", "1")}.cbm']
+
+    def no_download(name, version):
+        raise AssertionError('cached model was downloaded again')
+
+    monkeypatch.setattr(cache, 'download', no_download)
+    assert load_model('models:/delivery/1', cache=cache) is model
+
+    # A new process with an unreachable registry still resolves the alias
+    model_store.clear_memo()
+    monkeypatch.setenv('MLFLOW_TRACKING_URI', f'file://{tmp_path / "missing"}')
+    assert load_model('models:/delivery@champion', cache=cache) is not model
+
+
+def test_registry_uses_the_mlflow_server_by_default(tmp_path, monkeypatch):
+    # predict_batch and the backfill run with only the dev container's env
+    monkeypatch.delenv('MLFLOW_TRACKING_URI', raising=False)
+    tracking_uris = []
+
+    class Client:
+        def __init__(self, tracking_uri=None):
+            tracking_uris.append(tracking_uri)
+
+        def get_model_version_by_alias(self, name, alias):
+            raise ConnectionError('registry unreachable')
+
+    monkeypatch.setattr(mlflow.tracking, 'MlflowClient', Client)
+    with pytest.raises(ConnectionError):
+        ModelCache(tmp_path / 'cache').resolve('models:/delivery@champion')
+    assert tracking_uris == ['http://mlflow_container_ui:5000']
+
+
+def test_load_model_keeps_the_lock_from_resolve_to_load(
+    tmp_path, registered_model, monkeypatch
+):
+    cache = ModelCache(tmp_path / 'cache')
+    events = []
+    lock, download = cache.lock, cache.download
+    load_memoized = model_store._load_memoized
+
+    @contextmanager
+    def logged_lock(exclusive):
+        with lock(exclusive):
+            events.append('lock')
+            yield
+            events.append('unlock')
+
+    def logged_download(name, version):
+        events.append('download')
+        return download(name, version)
+
+    def logged_load(path, sha):
+        events.append('load')
+        return load_memoized(path, sha)
+
+    monkeypatch.setattr(cache, 'lock', logged_lock)
+    monkeypatch.setattr(cache, 'download', logged_download)
+    monkeypatch.setattr(model_store, '_load_memoized', logged_load)
+
+    # An eviction can only run between an unlock and the next lock
+    load_model('models:/delivery/1', cache=cache)
+    assert events == ['lock', 'unlock', 'lock', 'download', 'load', 'unlock']
+    events.clear()
+    load_model('models:/delivery/1', cache=cache)
+    assert events == ['lock', 'load', 'unlock']
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache = ModelCache(tmp_path / 'cache', max_bytes=10)
+    for i, name in enumerate(['old', 'new', 'kept']):
+        path = cache.object_path(name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * 4)
+        os.utime(path, (i, i))
+
+    cache.evict(keep='old')
+    assert sorted(os.listdir(cache.objects_dir)) == ['kept.cbm', 'old.cbm']
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from pg_io import DEFAULT_BATCH_SIZE, parse_pg_uri, pg_column_types, is_postgres_uri
+
+
+def test_parse_pg_uri_splits_options_from_conninfo():
+    conninfo, options = parse_pg_uri(
+        'postgresql://db_user:db_password@db:5432/test'
+        '?sslmode=disable&table=public.predictions&keys=order_id,customer_id'
+        '&batch_size=1000'
+    )
+
+    assert conninfo == 'postgresql://db_user:db_password@db:5432/test?sslmode=disable'
+    assert options == {
+        'table': 'public.predictions',
+        'keys': ['order_id', 'customer_id'],
+        'batch_size': 1000,
+    }
+
+
+def test_parse_pg_uri_query_and_defaults():
+    conninfo, options = parse_pg_uri(
+        'postgres://db/test?query=select+*+from+orders+where+seller_id+%3D+1'
+    )
+
+    assert conninfo == 'postgres://db/test'
+    assert options['query'] == 'select * from orders where seller_id = 1'
+    assert options['batch_size'] == DEFAULT_BATCH_SIZE
+    assert options['keys'] == []
+    assert is_postgres_uri(conninfo)
+    assert not is_postgres_uri('s3://delivery-prediction/batch.csv')
+
+
+def test_pg_column_types():
+    df = pd.DataFrame({
+        'order_id': ['a'],
+        'seller_zip_code_prefix': np.array([9350], dtype=np.int32),
+        'prediction': [1.5],
+        'delivered': [True],
+        'purchase_ts': pd.to_datetime(['2017-05-01']),
+    })
+
+    assert pg_column_types(df) == [
+        ('order_id', 'text'),
+        ('seller_zip_code_prefix', 'bigint'),
+        ('prediction', 'double precision'),
+        ('delivered', 'boolean'),
+        ('purchase_ts', 'timestamp'),
+    ]
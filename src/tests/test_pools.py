@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from catboost import CatBoostRegressor
+
+from pools import POOL_CACHE_DIR_NAME, load_pools, cache_training_pools
+
+CONFIG = {
+    'categorical': ['seller_zip_code_prefix'],
+    'numerical': ['delivery_distance_km'],
+}
+
+
+def write_dataset(path, rows, seed, sellers=(9350, 31842, 7112)):
+    rng = np.random.default_rng(seed)
+    seller = rng.choice(sellers, rows)
+    distance = rng.uniform(0, 2000, rows)
+    pd.DataFrame({
+        'seller_zip_code_prefix': seller,
+        'delivery_distance_km': distance,
+        # Sellers differ in speed, so the categorical feature carries signal
+        'delivery_time': seller % 13 + distance / 200 + rng.normal(0, 2, rows),
+    }).to_csv(path, index=False)
+
+
+def test_cache_training_pools(tmp_path):
+    config = CONFIG
+    write_dataset(tmp_path / 'train_dataset.csv', 50, seed=0)
+    write_dataset(tmp_path / 'valid_dataset.csv', 20, seed=1)
+
+    pool_files = cache_training_pools(str(tmp_path), config)
+    assert cache_training_pools(str(tmp_path), config) == pool_files
+    assert len(os.listdir(tmp_path / POOL_CACHE_DIR_NAME)) == 1
+
+    train_pool, valid_pool = load_pools(pool_files, config)
+    assert train_pool.is_quantized() and not valid_pool.is_quantized()
+    assert (train_pool.num_row(), valid_pool.num_row()) == (50, 20)
+
+    # New training data gets a new cache key
+    write_dataset(tmp_path / 'train_dataset.csv', 60, seed=2)
+    assert cache_training_pools(str(tmp_path), config) != pool_files
+
+
+def test_eval_rmse_matches_raw_validation_data(tmp_path):
+    sellers = np.arange(1000, 1200)
+    write_dataset(tmp_path / 'train_dataset.csv', 2000, seed=0, sellers=sellers)
+    write_dataset(tmp_path / 'valid_dataset.csv', 500, seed=1, sellers=sellers)
+
+    train_pool, valid_pool = load_pools(
+        cache_training_pools(str(tmp_path), CONFIG), CONFIG
+    )
+    model = CatBoostRegressor(
+        iterations=100,
+        cat_features=CONFIG['categorical'],
+        train_dir=str(tmp_path / 'catboost_info'),
+        verbose=0,
+    )
+    model.fit(train_pool, eval_set=valid_pool)
+
+    valid_df = pd.read_csv(tmp_path / 'valid_dataset.csv')
+    y_pred = model.predict(valid_df[CONFIG['categorical'] + CONFIG['numerical']])
+    raw_rmse = np.sqrt(np.mean((valid_df['delivery_time'] - y_pred) ** 2))
+    assert model.get_best_score()['validation']['RMSE'] == pytest.approx(raw_rmse)
@@ -1,9 +1,13 @@
+import shutil
 from datetime import datetime
 from datetime import timedelta
 
 import pandas as pd
 
-from prepare_data import preprocess_orders
+from geo_index import GEO_INDEX_DIR_NAME, META_FILE
+from stage_cache import StageCache
+from synthetic_olist import generate_dataset
+from prepare_data import preprocess_orders, split_train_valid, run_prepare_stages
 
 
 def dt(hour, minute=0, second=0):
@@ -29,3 +33,45 @@ def test_preprocess_orders():
 
     expected_delivery_time_sum = 3
     assert df_result['delivery_time'].sum() == expected_delivery_time_sum
+
+
+def test_split_train_valid():
+    df = pd.DataFrame({
+        'purchase_dt': ['2017-02-01', '2017-04-30', '2017-05-01', '2017-06-01'],
+        'delivery_time': [1, 2, 3, 4],
+    })
+    data_params = {
+        'train_date_start': '2017-02-01',
+        'train_date_end': '2017-04-30',
+        'valid_date_start': '2017-05-01',
+        'valid_date_end': '2017-05-31',
+    }
+
+    train_df, valid_df = split_train_valid(df, data_params)
+
+    assert train_df['delivery_time'].tolist() == [1, 2]
+    assert valid_df['delivery_time'].tolist() == [3]
+
+
+def test_prepare_stages_rebuild_a_missing_geo_index(tmp_path):
+    dataset_dir = tmp_path / 'dataset'
+    generate_dataset(dataset_dir, scale=0.05, seed=0)
+    cfg = {
+        'root_data_dir': str(tmp_path),
+        'data_params': {
+            'date_start': '2017-01-01',
+            'date_end': '2017-12-31',
+            'train_date_start': '2017-01-01',
+            'train_date_end': '2017-09-30',
+            'valid_date_start': '2017-10-01',
+            'valid_date_end': '2017-12-31',
+        },
+    }
+    stage_cache = StageCache(str(tmp_path), refresh='')
+    run_prepare_stages(cfg, str(dataset_dir), stage_cache)
+    index_dir = tmp_path / GEO_INDEX_DIR_NAME
+    assert (index_dir / META_FILE).exists()
+
+    shutil.rmtree(index_dir)
+    run_prepare_stages(cfg, str(dataset_dir), stage_cache)
+    assert (index_dir / META_FILE).exists()
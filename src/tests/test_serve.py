@@ -0,0 +1,14 @@
+from serve import worker_thread_count
+from run_benchmarks import default_worker_counts
+
+
+def test_worker_thread_count_splits_cores():
+    assert worker_thread_count(1, cpu_count=8) == 8
+    assert worker_thread_count(3, cpu_count=8) == 2
+    assert worker_thread_count(16, cpu_count=8) == 1
+
+
+def test_default_worker_counts():
+    assert default_worker_counts(1) == [1]
+    assert default_worker_counts(6) == [1, 2, 4, 6]
+    assert default_worker_counts(8) == [1, 2, 4, 8]
@@ -0,0 +1,44 @@
+from stage_cache import StageCache
+
+
+def test_stage_cache_skips_until_inputs_change(tmp_path):
+    data_path = tmp_path / 'input.csv'
+    data_path.write_text('a\n1\n')
+    output_path = tmp_path / 'output.csv'
+    calls = []
+
+    def stage():
+        calls.append(1)
+        output_path.write_text(data_path.read_text())
+        return {'rows': 1}
+
+    def run(config):
+        return StageCache(tmp_path).run(
+            'copy',
+            stage,
+            files=[str(data_path)],
+            config=[config],
+            code=('stage_cache',),
+            outputs=[str(output_path)],
+        )
+
+    assert run({'x': 1}) == {'rows': 1}
+    assert run({'x': 1}) == {'rows': 1}
+    assert len(calls) == 1
+
+    run({'x': 2})  # config changed
+    assert len(calls) == 2
+
+    output_path.write_text('tampered')  # output no longer matches the manifest
+    run({'x': 2})
+    assert len(calls) == 3
+
+    data_path.write_text('a\n2\n')  # input changed
+    run({'x': 2})
+    assert len(calls) == 4
+
+    StageCache(tmp_path, refresh='copy').run(
+        'copy', stage, files=[str(data_path)], config=[{'x': 2}],
+        code=('stage_cache',), outputs=[str(output_path)],
+    )
+    assert len(calls) == 5
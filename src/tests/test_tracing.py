@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture
+def spans_file(tmp_path):
+    path = tmp_path / 'spans.jsonl'
+    tracing.configure(enabled=True, sink=str(path), job='test')
+    yield path
+    tracing.configure(enabled=False)
+
+
+def read_spans(path):
+    tracing.flush()
+    with open(path, encoding='utf-8') as f:
+        return {record['name']: record for record in map(json.loads, f)}
+
+
+def test_spans_nest_and_record_usage(spans_file):
+    @tracing.traced('stage')
+    def stage():
+        with tracing.span('step', rows=3, source='csv') as span:
+            sum(range(10_000))
+            span.set(extra=1)
+
+    stage()
+    with pytest.raises(ValueError):
+        with tracing.span('failing'):
+            raise ValueError
+
+    spans = read_spans(spans_file)
+    assert spans['step']['parent_id'] == spans['stage']['span_id']
+    assert spans['stage']['parent_id'] is None
+    assert spans['step']['num_rows'] == 3
+    assert spans['step']['attrs'] == {'source': 'csv', 'extra': 1}
+    assert spans['stage']['wall_s'] >= spans['step']['wall_s'] > 0
+    assert spans['step']['cpu_s'] >= 0
+    assert spans['step']['job'] == 'test'
+    assert spans['failing']['status'] == 'error: ValueError'
+
+
+def test_profiles_keep_slowest_spans(tmp_path, spans_file):
+    tracing.configure(
+        enabled=True,
+        sink=str(spans_file),
+        profile='work',
+        profile_dir=str(tmp_path / 'profiles'),
+        profile_top=1,
+    )
+    for n in (10, 200_000, 10):
+        with tracing.span('work'):
+            sum(range(n))
+
+    profiles = list((tmp_path / 'profiles').iterdir())
+    assert len(profiles) == 1
+    tracing.flush()
+    slowest = max(
+        map(json.loads, spans_file.read_text().splitlines()), key=lambda r: r['wall_s']
+    )
+    assert slowest['attrs']['profile'] == str(profiles[0])
+
+
+def test_disabled_tracing_is_a_no_op(tmp_path):
+    tracing.configure(enabled=False)
+    with tracing.span('step', rows=1) as span:
+        span.set(rows=2)
+    assert not tracing.enabled()
+    assert tracing.traced()(lambda: 42)() == 42
@@ -0,0 +1,365 @@
+"""Lightweight span tracing for batch jobs.
+
+    with tracing.span('merge_datasets') as s:
+        df = merge(...)
+        s.set(rows=len(df))
+
+    @tracing.traced('predict')
+    def predict(...): ...
+
+A span records wall time, CPU time of the process, the growth of the
+process peak RSS while it was open, a row count and free-form attributes.
+Spans nest per thread/task through a context variable. Finished spans are
+buffered and written in bulk to the sink when the buffer fills, on flush()
+and at exit. The sink is a Postgres table (`trace_spans`, read by the Grafana
+"Pipeline Traces" dashboard) or a JSONL file.
+
+Configured from the environment:
+    TRACING=1                   enable tracing (off by default)
+    TRACING_SINK                libpq conninfo/URL, or a path ending in .jsonl
+    TRACING_PROFILE             comma-separated span names to cProfile, or *
+    TRACING_PROFILE_DIR         where .prof dumps go
+    TRACING_PROFILE_TOP         how many of the slowest profiled spans to keep
+
+Disabled, span() returns a shared no-op object and traced() calls straight
+through, so instrumented code pays one attribute check per call.
+"""
+import os
+import sys
+import json
+import heapq
+import time
+import uuid
+import atexit
+import socket
+import cProfile
+import logging
+import resource
+import functools
+import threading
+import contextvars
+from datetime import datetime, timezone
+
+DEFAULT_SINK = "host=db port=5432 dbname=test user=db_user password=db_password"
+SPANS_TABLE = 'trace_spans'
+BUFFER_SIZE = 1000
+
+SPAN_COLUMNS = (
+    'trace_id',
+    'span_id',
+    'parent_id',
+    'job',
+    'name',
+    'started_at',
+    'wall_s',
+    'cpu_s',
+    'peak_rss_delta_mb',
+    'num_rows',
+    'status',
+    'attrs',
+    'host',
+    'pid',
+)
+
+create_table_statement = f"""
+create table if not exists {SPANS_TABLE}(
+	trace_id text,
+	span_id text,
+	parent_id text,
+	job text,
+	name text,
+	started_at timestamptz,
+	wall_s double precision,
+	cpu_s double precision,
+	peak_rss_delta_mb double precision,
+	num_rows bigint,
+	status text,
+	attrs jsonb,
+	host text,
+	pid integer
+);
+create index if not exists {SPANS_TABLE}_started_at_idx on {SPANS_TABLE} (started_at);
+create index if not exists {SPANS_TABLE}_trace_id_idx on {SPANS_TABLE} (trace_id);
+"""
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class PostgresSink:
+    def __init__(self, conninfo):
+        self.conninfo = conninfo
+        self._table_ready = False
+
+    def write(self, records):
+        import psycopg
+
+        with psycopg.connect(self.conninfo, autocommit=True) as conn:
+            if not self._table_ready:
+                conn.execute(create_table_statement)
+                self._table_ready = True
+            with conn.cursor() as cursor:
+                with cursor.copy(
+                    f"COPY {SPANS_TABLE} ({', '.join(SPAN_COLUMNS)}) FROM STDIN"
+                ) as copy:
+                    for record in records:
+                        copy.write_row(
+                            [
+                                json.dumps(record[c]) if c == 'attrs' else record[c]
+                                for c in SPAN_COLUMNS
+                            ]
+                        )
+
+
+class JsonlSink:
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, records):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + '\n')
+
+
+def make_sink(target):
+    if target.endswith('.jsonl'):
+        return JsonlSink(target)
+    return PostgresSink(target)
+
+
+class Profiles:
+    """cProfile dumps, keeping only the `top` slowest spans on disk."""
+
+    def __init__(self, names, out_dir, top):
+        self.names = names
+        self.out_dir = out_dir
+        self.top = top
+        self._kept = []  # (wall_s, path), fastest on top
+        self._lock = threading.Lock()
+        self._active = False
+
+    def wants(self, name):
+        return not self._active and ('*' in self.names or name in self.names)
+
+    def start(self):
+        self._active = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def stop(self, profiler, record):
+        profiler.disable()
+        self._active = False
+        with self._lock:
+            if len(self._kept) >= self.top and record['wall_s'] <= self._kept[0][0]:
+                return
+            os.makedirs(self.out_dir, exist_ok=True)
+            path = os.path.join(
+                self.out_dir,
+                f"{record['job']}-{record['name']}-{record['span_id']}.prof",
+            )
+            profiler.dump_stats(path)  # pstats format: snakeviz, python -m pstats
+            record['attrs']['profile'] = path
+            heapq.heappush(self._kept, (record['wall_s'], path))
+            if len(self._kept) > self.top:
+                _, evicted = heapq.heappop(self._kept)
+                try:
+                    os.remove(evicted)
+                except FileNotFoundError:
+                    pass
+
+
+class Tracer:
+    def __init__(self, sink, job, trace_id, profiles=None, buffer_size=BUFFER_SIZE):
+        self.sink = sink
+        self.job = job
+        self.trace_id = trace_id
+        self.profiles = profiles
+        self.buffer_size = buffer_size
+        self.host = socket.gethostname()
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        with self._lock:
+            self._buffer.append(record)
+            full = len(self._buffer) >= self.buffer_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            records, self._buffer = self._buffer, []
+        if not records:
+            return
+        try:
+            self.sink.write(records)
+        except Exception:  # tracing must never take the job down
+            logger.exception("Failed to write %d trace spans", len(records))
+
+
+class Span:
+    __slots__ = (
+        'tracer',
+        'name',
+        'span_id',
+        'parent_id',
+        'rows',
+        'attrs',
+        '_token',
+        '_started_at',
+        '_wall',
+        '_cpu',
+        '_maxrss',
+        '_profiler',
+    )
+
+    def __init__(self, tracer, name, attrs, rows=None):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.rows = rows
+        self.span_id = uuid.uuid4().hex[:16]
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent is not None else None
+
+    def set(self, rows=None, **attrs):
+        if rows is not None:
+            self.rows = int(rows)
+        self.attrs.update(attrs)
+        return self
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        profiles = self.tracer.profiles
+        self._profiler = None
+        if profiles is not None and profiles.wants(self.name):
+            self._profiler = profiles.start()
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        self._maxrss = usage.ru_maxrss
+        self._cpu = usage.ru_utime + usage.ru_stime
+        self._started_at = datetime.now(timezone.utc)
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        _current_span.reset(self._token)
+        record = {
+            'trace_id': self.tracer.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'job': self.tracer.job,
+            'name': self.name,
+            'started_at': self._started_at.isoformat(),
+            'wall_s': wall,
+            'cpu_s': usage.ru_utime + usage.ru_stime - self._cpu,
+            # ru_maxrss is in KiB on Linux
+            'peak_rss_delta_mb': (usage.ru_maxrss - self._maxrss) / 1024,
+            'num_rows': self.rows,
+            'status': 'ok' if exc_type is None else f'error: {exc_type.__name__}',
+            'attrs': self.attrs,
+            'host': self.tracer.host,
+            'pid': os.getpid(),
+        }
+        if self._profiler is not None:
+            self.tracer.profiles.stop(self._profiler, record)
+        self.tracer.record(record)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+    rows = None
+
+    def set(self, rows=None, **attrs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+_tracer = None
+
+
+def configure(
+    enabled=None, sink=None, job=None, profile=None, profile_dir=None, profile_top=None
+):
+    """(Re)configure tracing; arguments left as None are read from the environment."""
+    global _tracer
+
+    if _tracer is not None:
+        _tracer.flush()
+    if enabled is None:
+        enabled = os.getenv('TRACING', '').lower() in ('1', 'true', 'yes')
+    if not enabled:
+        _tracer = None
+        return None
+
+    if sink is None:
+        sink = make_sink(os.getenv('TRACING_SINK', DEFAULT_SINK))
+    elif isinstance(sink, str):
+        sink = make_sink(sink)
+    if job is None:
+        job = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+
+    # Child processes (e.g. HPO trial workers) inherit the trace id
+    trace_id = os.environ.setdefault('TRACE_ID', uuid.uuid4().hex)
+
+    if profile is None:
+        profile = os.getenv('TRACING_PROFILE', '')
+    names = {name.strip() for name in profile.split(',') if name.strip()}
+    profiles = None
+    if names:
+        profiles = Profiles(
+            names,
+            profile_dir or os.getenv('TRACING_PROFILE_DIR', 'trace_profiles'),
+            int(profile_top or os.getenv('TRACING_PROFILE_TOP', 5)),
+        )
+
+    _tracer = Tracer(sink, job, trace_id, profiles=profiles)
+    return _tracer
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name, rows=None, **attrs):
+    if _tracer is None:
+        return _NOOP_SPAN
+    return Span(_tracer, name, attrs, rows)
+
+
+def traced(name=None):
+    """Decorator running the function inside a span named after it by default."""
+
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return fn(*args, **kwargs)
+            with Span(_tracer, span_name, {}):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def flush():
+    if _tracer is not None:
+        _tracer.flush()
+
+
+configure()
+atexit.register(flush)
@@ -1,13 +1,16 @@
 import os
+import json
+import hashlib
 import logging
 
 import yaml
 import pandas as pd
 from dotenv import load_dotenv
-from catboost import CatBoostRegressor
+from catboost import Pool, CatBoostRegressor
 
 load_dotenv()
 options = {'client_kwargs': {'endpoint_url': 'http://localstack:4566'}}
+_fingerprints = {}
 
 
 def get_model(params, categorical=None):
@@ -38,6 +41,24 @@ def get_config(config_path=None):
     return config
 
 
+def file_fingerprint(path):
+    """SHA-256 of the file content, memoized on (path, size, mtime)."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _fingerprints:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        _fingerprints[key] = digest.hexdigest()
+    return _fingerprints[key]
+
+
+def config_fingerprint(*sections):
+    payload = json.dumps(sections, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
 def get_features(df):
     categorical = ['seller_zip_code_prefix', 'customer_zip_code_prefix']
     numerical = [
@@ -61,21 +82,30 @@ def filter_df_by_date(df, dt_col, date_filter):
     return df
 
 
-def train_and_save_model(train_df, config, params, model_path):
-    if os.path.exists(model_path):
-        return
-
+def train_and_save_model(
+    train_data, config, params, model_path, eval_set=None, early_stopping_rounds=None
+):
+    """Train on a DataFrame or a ready CatBoost Pool and save the model."""
     categorical = config['categorical']
-    numerical = config['numerical']
-    target = 'delivery_time'
-    X_train = train_df[categorical + numerical]
-    y_train = train_df[target]
+    if isinstance(train_data, Pool):
+        X_train, y_train = train_data, None
+    else:
+        numerical = config['numerical']
+        target = 'delivery_time'
+        X_train = train_data[categorical + numerical]
+        y_train = train_data[target]
 
     model = get_model(params, categorical)
     print('Start trainig')
-    model.fit(X_train, y_train)
+    model.fit(
+        X_train,
+        y_train,
+        eval_set=eval_set,
+        early_stopping_rounds=early_stopping_rounds,
+    )
     print('Trainig finished')
     model.save_model(model_path)
+    return model
 
 
 def read_data(data_path, start_dt, end_dt):